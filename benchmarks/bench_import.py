@@ -0,0 +1,58 @@
+"""
+Import-time budget for plugin discovery.
+
+napari imports ``napari_ml_particle_tracking`` to locate ``napari.yaml`` on
+every start, that import has to stay cheap and must not pull in the heavy
+dependencies. Exits with status 1 when the budget is exceeded.
+
+    python benchmarks/bench_import.py --budget-ms 50
+"""
+import argparse
+import subprocess
+import sys
+
+_HEAVY_MODULES_ = ('torch', 'particle_tracking', 'pandas', 'matplotlib', 'tifffile', 'napari', 'qtpy', 'PyQt5')
+
+_PROBE_ = """
+import sys
+import {module}
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(','.join(heavy))
+"""
+
+
+def import_time(module: str):
+    """Cumulative import time of ``module`` in microseconds and the heavy modules it loaded."""
+    probe = _PROBE_.format(module=module, heavy=_HEAVY_MODULES_)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', probe],
+                            capture_output=True, text=True, check=True)
+    cumulative = 0
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative = int(parts[1])
+    heavy = [name for name in result.stdout.strip().split(',') if name]
+    return cumulative, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budget-ms', type=float, default=50.0)
+    parser.add_argument('--module', default='napari_ml_particle_tracking')
+    args = parser.parse_args()
+
+    cumulative, heavy = import_time(args.module)
+    print(f"{args.module}: {cumulative / 1000:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    failed = False
+    if heavy:
+        print(f"FAIL: importing {args.module} loads {', '.join(heavy)}")
+        failed = True
+    if cumulative / 1000 > args.budget_ms:
+        print("FAIL: import time over budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
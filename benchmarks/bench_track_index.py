@@ -0,0 +1,80 @@
+"""
+Compare per-track lookups through ``groupby(...).get_group`` with the CSR
+style ``TrackIndex`` on synthetic tracks: single track lookups (table
+selection, intensity plot), intensity traces of a selection (step
+analysis) and napari layer data.
+
+    python benchmarks/bench_track_index.py --tracks 50000 --length 40
+"""
+import argparse
+import time
+
+import numpy as np
+from bench_tracks_layer import old_tracks_layer_data
+from synthetic import synthetic_tracks
+
+from napari_ml_particle_tracking._tracks import TrackIndex
+
+
+def timeit(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def group_tracks(tracked_df):
+    return tracked_df.groupby('particle', as_index=False, group_keys=True, dropna=True)
+
+
+def group_lookups(group, track_ids):
+    return [group.get_group(track_id)['intensity_mean'].to_numpy() for track_id in track_ids]
+
+
+def index_lookups(index, track_ids):
+    return [index.column(track_id, 'intensity_mean') for track_id in track_ids]
+
+
+def group_traces(tracked_df, track_ids):
+    selected = tracked_df[tracked_df['particle'].isin(track_ids)]
+    return [(track_id, track['intensity_mean'].to_numpy()) for track_id, track in selected.groupby('particle', sort=True)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--length', type=int, default=40)
+    parser.add_argument('--lookups', type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for n_tracks in args.tracks:
+        df = synthetic_tracks(n_tracks, args.length)
+        lookup_ids = rng.choice(n_tracks, size=args.lookups)
+        selected_ids = np.arange(0, n_tracks, 2)
+
+        t_group, group = timeit(group_tracks, df)
+        t_index, index = timeit(TrackIndex, df)
+
+        t_group_lookup, old = timeit(group_lookups, group, lookup_ids)
+        t_index_lookup, new = timeit(index_lookups, index, lookup_ids)
+        assert all(np.array_equal(a, b) for a, b in zip(old, new))
+
+        t_group_traces, old = timeit(group_traces, df, selected_ids)
+        t_index_traces, new = timeit(index.traces, selected_ids)
+        assert all(a[0] == b[0] and np.array_equal(a[1], b[1]) for a, b in zip(old, new))
+
+        t_group_layer, old = timeit(old_tracks_layer_data, df, selected_ids)
+        t_index_layer, new = timeit(index.layer_data, selected_ids)
+        assert np.array_equal(old, new)
+
+        print(f"tracks: {n_tracks:>7}  build     groupby: {t_group:8.4f}s  index: {t_index:8.4f}s")
+        print(f"{'':16}lookup    groupby: {t_group_lookup / args.lookups * 1e6:8.1f}us  "
+              f"index: {t_index_lookup / args.lookups * 1e6:8.1f}us  speedup: {t_group_lookup / t_index_lookup:6.1f}x")
+        print(f"{'':16}traces    groupby: {t_group_traces:8.4f}s  index: {t_index_traces:8.4f}s  "
+              f"speedup: {t_group_traces / t_index_traces:6.1f}x")
+        print(f"{'':16}layer     groupby: {t_group_layer:8.4f}s  index: {t_index_layer:8.4f}s  "
+              f"speedup: {t_group_layer / t_index_layer:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Compare the old per-track ``get_group`` + ``np.concatenate`` loop with the
+vectorized ``tracks_layer_data`` on synthetic tracks.
+
+    python benchmarks/bench_tracks_layer.py --tracks 50000 --length 40
+"""
+import argparse
+import time
+
+import numpy as np
+from synthetic import synthetic_tracks
+
+from napari_ml_particle_tracking._tracks import tracks_layer_data
+
+
+def old_tracks_layer_data(tracked_df, track_ids):
+    group = tracked_df.groupby('particle', as_index=False, group_keys=True, dropna=True)
+    tracks = []
+    for track_id in track_ids:
+        track = group.get_group(track_id)
+        if not len(tracks):
+            tracks = track[['particle', 'frame', 'y', 'x']].to_numpy()
+        else:
+            tracks = np.concatenate([tracks, track[['particle', 'frame', 'y', 'x']].to_numpy()])
+    return tracks
+
+
+def timeit(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--length', type=int, default=40)
+    args = parser.parse_args()
+
+    for n_tracks in args.tracks:
+        df = synthetic_tracks(n_tracks, args.length)
+        track_ids = np.arange(0, n_tracks, 2)
+        t_old, old = timeit(old_tracks_layer_data, df, track_ids)
+        t_new, new = timeit(tracks_layer_data, df, track_ids)
+        assert np.array_equal(old, new)
+        print(f"tracks: {n_tracks:>7}  old: {t_old:8.3f}s  new: {t_new:8.3f}s  speedup: {t_old / t_new:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
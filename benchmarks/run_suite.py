@@ -0,0 +1,300 @@
+"""
+Benchmark suite over the hot paths of the plugin at several data scales.
+
+Times segmentation, feature extraction and linking, building the tracks
+layer, step analysis, meta filtering, table model painting and histogram
+redraws on synthetic data (see ``synthetic.py``), writes the timings as
+JSON and, given a baseline, exits with status 1 when a benchmark got
+slower than the baseline by more than ``--tolerance``.
+
+    python benchmarks/run_suite.py --scales small medium --output results.json
+    python benchmarks/run_suite.py --save-baseline baseline.json
+    python benchmarks/run_suite.py --baseline baseline.json --tolerance 0.25
+
+Benchmarks whose dependencies are missing (torch and the trained model for
+segmentation, particle_tracking for the step analysis, Qt for the table and
+histogram) are reported as skipped.
+Baselines are only comparable on the same machine.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from synthetic import synthetic_movie, synthetic_tracks
+
+SCALES = {
+    'small': {'frames': 20, 'shape': (128, 128), 'particles': 20, 'tracks': 1000, 'length': 40, 'step_tracks': 200},
+    'medium': {'frames': 100, 'shape': (256, 256), 'particles': 100, 'tracks': 10000, 'length': 40, 'step_tracks': 1000},
+    'large': {'frames': 200, 'shape': (512, 512), 'particles': 400, 'tracks': 50000, 'length': 60, 'step_tracks': 5000},
+}
+
+
+class Skipped(Exception):
+    pass
+
+
+def best_time(func, repeat):
+    """Fastest of ``repeat`` calls of ``func``, the least disturbed by other load."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def _requires(module):
+    try:
+        __import__(module)
+    except ImportError:
+        raise Skipped(f"{module} is not installed") from None
+
+
+_QT_APP_ = None
+
+
+def _qt_app():
+    global _QT_APP_
+    _requires('qtpy')
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from qtpy.QtWidgets import QApplication
+    if _QT_APP_ is None:
+        _QT_APP_ = QApplication.instance() or QApplication([])
+    return _QT_APP_
+
+
+class Data:
+    """Synthetic inputs of one scale, generated on first use."""
+    def __init__(self, scale):
+        self.scale = scale
+        self._movie = None
+        self._tracks = None
+        self._meta = None
+
+    @property
+    def movie(self):
+        if self._movie is None:
+            s = self.scale
+            self._movie = synthetic_movie(s['frames'], s['shape'], s['particles'])
+        return self._movie
+
+    @property
+    def tracks(self):
+        if self._tracks is None:
+            self._tracks = synthetic_tracks(self.scale['tracks'], self.scale['length'])
+        return self._tracks
+
+    @property
+    def meta(self):
+        """Track meta with a frame count and a few float properties to filter on."""
+        if self._meta is None:
+            from napari_ml_particle_tracking._tracks import (
+                tracks_frame_count_meta,
+            )
+
+            rng = np.random.default_rng(1)
+            meta = tracks_frame_count_meta(self.tracks)
+            # vary the track lengths, synthetic tracks all have the same
+            meta['frame'] = rng.integers(1, 200, size=len(meta))
+            meta['intensity_mean'] = rng.gamma(2.0, 100.0, size=len(meta))
+            meta['step_count'] = rng.integers(0, 5, size=len(meta))
+            self._meta = meta
+        return self._meta
+
+
+# benchmarks, each returns (seconds, number of processed units)
+
+def bench_segmentation(data, repeat):
+    _requires('torch')
+    _requires('particle_tracking')
+    from napari_ml_particle_tracking._model import _MODEL_FILE_PATH_
+    from napari_ml_particle_tracking._pipeline import iter_segment
+
+    if not _MODEL_FILE_PATH_.exists():
+        raise Skipped(f"no trained model at {_MODEL_FILE_PATH_}")
+    image = data.movie[0]
+    mask = np.zeros(image.shape, dtype=np.uint8)
+    # builds the shared model outside of the timed runs
+    next(iter_segment(image[:1], mask[:1]))
+    return best_time(lambda: list(iter_segment(image, mask)), repeat), len(image)
+
+
+def bench_features_linking(data, repeat):
+    from napari_ml_particle_tracking._pipeline import track_stack
+
+    image, mask, _ = data.movie
+    return best_time(lambda: track_stack(mask, image, search_range=3.0, memory=1), repeat), len(image)
+
+
+def bench_tracks_layer(data, repeat):
+    from napari_ml_particle_tracking._tracks import TrackIndex
+
+    tracks = data.tracks
+    return best_time(lambda: TrackIndex(tracks).layer_data(), repeat), data.scale['tracks']
+
+
+def bench_step_analysis(data, repeat):
+    _requires('particle_tracking')
+    from napari_ml_particle_tracking._pipeline import find_steps
+    from napari_ml_particle_tracking._tracks import TrackIndex
+
+    # the step analysis of the Steps button and the batch pipeline, without a cache
+    n = data.scale['step_tracks']
+    index = TrackIndex(data.tracks)
+    return best_time(lambda: find_steps(index, np.arange(n)), repeat), n
+
+
+def bench_filtering(data, repeat):
+    from napari_ml_particle_tracking._tracks import PropertyIndex
+
+    meta = data.meta
+    # a slider drag: the range on one property moves while another stays set
+    sweep = [{'frame': (lo, 200), 'intensity_mean': (50.0, 400.0)} for lo in range(1, 100, 5)]
+
+    def run():
+        index = PropertyIndex(meta)
+        for ranges in sweep:
+            meta.iloc[index.query(ranges)]
+    return best_time(run, repeat), len(sweep)
+
+
+def bench_table_paint(data, repeat):
+    _qt_app()
+    from qtpy.QtCore import Qt
+
+    from napari_ml_particle_tracking._table_widget import DataFrameModel
+
+    meta = data.meta
+    model = DataFrameModel()
+    visible_rows = 40
+
+    def run():
+        model.setDataframe(meta)
+        model.sort(2, Qt.SortOrder.DescendingOrder)
+        # scroll through the table a page at a time
+        while model.canFetchMore():
+            model.fetchMore()
+        for top in range(0, model.rowCount(), 10 * visible_rows):
+            for row in range(top, min(top + visible_rows, model.rowCount())):
+                for col in range(model.columnCount()):
+                    model.data(model.index(row, col))
+    return best_time(run, repeat), len(meta)
+
+
+def bench_histogram_redraw(data, repeat):
+    app = _qt_app()
+    from napari_ml_particle_tracking._plots import HistogramWidget
+
+    meta = data.meta
+    widget = HistogramWidget()
+    widget.show()
+    values = meta['intensity_mean'].to_numpy()
+    cuts = np.linspace(values.min(), values.max(), 21)[:-1]
+
+    def run():
+        widget.set_data(meta['intensity_mean'], label='intensity_mean')
+        app.processEvents()
+        for lo in cuts:
+            widget.update_counts(values[values >= lo])
+            widget.set_range(lo, values.max())
+            app.processEvents()
+    seconds = best_time(run, repeat)
+    widget.close()
+    return seconds, len(cuts)
+
+
+BENCHMARKS = {
+    'segmentation': bench_segmentation,
+    'features_linking': bench_features_linking,
+    'tracks_layer': bench_tracks_layer,
+    'step_analysis': bench_step_analysis,
+    'filtering': bench_filtering,
+    'table_paint': bench_table_paint,
+    'histogram_redraw': bench_histogram_redraw,
+}
+
+
+def run_suite(scales, benchmarks, repeat=3, log=print):
+    results = {}
+    for scale_name in scales:
+        data = Data(SCALES[scale_name])
+        results[scale_name] = {}
+        for name in benchmarks:
+            try:
+                seconds, units = BENCHMARKS[name](data, repeat)
+            except Skipped as e:
+                results[scale_name][name] = {'skipped': str(e)}
+                log(f"{scale_name:>8}  {name:<18} skipped: {e}")
+                continue
+            results[scale_name][name] = {'seconds': seconds, 'units': units, 'per_second': units / seconds}
+            log(f"{scale_name:>8}  {name:<18} {seconds:10.4f}s  {units / seconds:12.1f}/s")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Rows of every benchmark timed in both runs, ``regression`` when slower than ``1 + tolerance`` times the baseline."""
+    rows = []
+    for scale_name, benches in results.items():
+        for name, result in benches.items():
+            reference = baseline.get(scale_name, {}).get(name, {})
+            if 'seconds' not in result or 'seconds' not in reference:
+                continue
+            ratio = result['seconds'] / reference['seconds']
+            rows.append({'scale': scale_name, 'benchmark': name, 'baseline': reference['seconds'],
+                         'seconds': result['seconds'], 'ratio': ratio, 'regression': ratio > 1 + tolerance})
+    return pd.DataFrame(rows, columns=['scale', 'benchmark', 'baseline', 'seconds', 'ratio', 'regression'])
+
+
+def environment():
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['small', 'medium'])
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=3, help="runs per benchmark, the fastest counts")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="results JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown against the baseline")
+    parser.add_argument('--save-baseline', help="write the results as a new baseline to this JSON file")
+    args = parser.parse_args(argv)
+
+    report = {'environment': environment(), 'repeat': args.repeat,
+              'results': run_suite(args.scales, args.benchmarks, args.repeat)}
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    table = compare(report['results'], baseline['results'], args.tolerance)
+    print()
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    regressions = table[table['regression']]
+    if len(regressions):
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%} of the baseline "
+              f"from {baseline['environment']['timestamp']}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Synthetic data for the benchmarks.
+
+``synthetic_movie`` renders diffusing particles with photobleaching steps
+into a noisy image stack and returns the ground truth mask and tracks with
+it. ``synthetic_tracks`` builds track tables of any size without rendering
+images.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _alive_fluorophores(rng, n_particles, n_frames, n_fluorophores=(1, 4), bleach_time=None):
+    """``(n_particles, n_frames)`` count of fluorophores that have not bleached yet."""
+    bleach_time = bleach_time or n_frames / 2
+    counts = rng.integers(n_fluorophores[0], n_fluorophores[1] + 1, size=n_particles)
+    bleach = rng.exponential(bleach_time, size=(n_particles, n_fluorophores[1]))
+    bleach[np.arange(n_fluorophores[1])[np.newaxis] >= counts[:, np.newaxis]] = -1
+    return (bleach[:, np.newaxis, :] > np.arange(n_frames)[np.newaxis, :, np.newaxis]).sum(axis=2)
+
+
+def synthetic_movie(n_frames=100, shape=(256, 256), n_particles=50, diffusion=0.5, psf_sigma=1.5,
+                    brightness=200.0, background=100.0, noise=10.0, n_fluorophores=(1, 4),
+                    bleach_time=None, seed=0):
+    """
+    ``(image, mask, tracks)``: a ``(T, H, W)`` uint16 stack of gaussian spots
+    doing a random walk (reflected at the borders) whose brightness drops in
+    steps as fluorophores bleach, the uint8 mask of the visible spots and the
+    ground truth track table.
+    """
+    rng = np.random.default_rng(seed)
+    height, width = shape
+    margin = 3 * psf_sigma
+    low, high = np.array([margin, margin]), np.array([height - 1 - margin, width - 1 - margin])
+    start = rng.uniform(low, high, size=(n_particles, 2))
+    walk = start + np.cumsum(rng.normal(0, np.sqrt(2 * diffusion), size=(n_frames, n_particles, 2)), axis=0)
+    # reflect into [low, high]
+    span = high - low
+    walk = np.abs((walk - low) % (2 * span) - span)
+    walk = high - walk
+    alive = _alive_fluorophores(rng, n_particles, n_frames, n_fluorophores, bleach_time)
+    amplitude = brightness * alive.T
+
+    radius = int(np.ceil(3 * psf_sigma))
+    offsets = np.arange(-radius, radius + 1)
+    dy, dx = [o.ravel() for o in np.meshgrid(offsets, offsets, indexing='ij')]
+    image = np.empty((n_frames, height, width), dtype=np.uint16)
+    mask = np.zeros((n_frames, height, width), dtype=np.uint8)
+    for frame in range(n_frames):
+        pos = walk[frame]
+        yy = np.round(pos[:, 0]).astype(np.int64)[:, np.newaxis] + dy
+        xx = np.round(pos[:, 1]).astype(np.int64)[:, np.newaxis] + dx
+        profile = np.exp(-((yy - pos[:, :1]) ** 2 + (xx - pos[:, 1:]) ** 2) / (2 * psf_sigma ** 2))
+        flat = (yy * width + xx).ravel()
+        spots = np.bincount(flat, weights=(amplitude[frame][:, np.newaxis] * profile).ravel(), minlength=height * width)
+        signal = background + spots.reshape(height, width) + rng.normal(0, noise, size=(height, width))
+        image[frame] = np.clip(signal, 0, np.iinfo(np.uint16).max)
+        visible = (profile > 0.3) & (amplitude[frame][:, np.newaxis] > 0)
+        mask[frame].ravel()[flat[visible.ravel()]] = 1
+
+    tracks = pd.DataFrame({
+        'particle': np.tile(np.arange(n_particles), n_frames),
+        'frame': np.repeat(np.arange(n_frames), n_particles),
+        'y': walk[:, :, 0].ravel(),
+        'x': walk[:, :, 1].ravel(),
+        'intensity_mean': amplitude.ravel(),
+    })
+    return image, mask, tracks
+
+
+def synthetic_tracks(n_tracks, length, seed=0, noise=10.0):
+    """Track table with ``length`` frames per track and photobleaching intensities, rows interleaved by frame."""
+    rng = np.random.default_rng(seed)
+    n = n_tracks * length
+    intensity = 200.0 * _alive_fluorophores(rng, n_tracks, length) + rng.normal(0, noise, size=(n_tracks, length))
+    df = pd.DataFrame({
+        'particle': np.repeat(np.arange(n_tracks), length),
+        'frame': np.tile(np.arange(length), n_tracks),
+        'y': rng.random(n) * 512,
+        'x': rng.random(n) * 512,
+        'intensity_mean': intensity.ravel(),
+    })
+    # tracks usually come out of the linker interleaved by frame
+    return df.sort_values(['frame', 'particle'], kind='stable').reset_index(drop=True)
+
@@ -1,10 +1,18 @@
 __version__ = "0.0.1"
-from ._widget import PluginWrapper
 
 __all__ = (
-    "PluginWrapper"
+    "PluginWrapper",
 )
 
+
+def __getattr__(name):
+    # napari imports the package to locate napari.yaml, keep that import free of
+    # Qt/pandas/matplotlib and load the widgets only when they are requested
+    if name == "PluginWrapper":
+        from ._widget import PluginWrapper
+        return PluginWrapper
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 """
 # UI Plan
 
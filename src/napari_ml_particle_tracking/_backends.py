@@ -0,0 +1,177 @@
+"""
+CPU inference backends for the segmentation model.
+
+A predictor maps a ``(N, H, W)`` float32 batch of normalized, stride padded
+tiles to foreground probabilities. Besides plain float32 PyTorch there are
+bfloat16 autocast, int8 post-training quantization, TorchScript and ONNX
+Runtime predictors. ``validate_predictor`` checks that a backend keeps the
+masks within a given IoU of the float32 result.
+"""
+import contextlib
+import threading
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from ._model import _MODEL_DIR_, _MODEL_FILE_PATH_
+
+BACKENDS = ('float32', 'bfloat16', 'int8', 'torchscript', 'onnx')
+
+_PREDICTOR_CACHE_ = {}
+_PREDICTOR_LOCK_ = threading.Lock()
+
+
+class Predictor:
+    """Maps a ``(N, H, W)`` float32 batch of tiles to foreground probabilities."""
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class TorchPredictor(Predictor):
+    def __init__(self, model, autocast_dtype=None) -> None:
+        self.model = model
+        self.model.eval()
+        self.autocast_dtype = autocast_dtype
+
+    def _device(self):
+        import torch
+        try:
+            return next(self.model.parameters()).device
+        except (AttributeError, StopIteration, RuntimeError):
+            return torch.device('cpu')
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        import torch
+        autocast = contextlib.nullcontext()
+        if self.autocast_dtype is not None:
+            autocast = torch.autocast('cpu', dtype=self.autocast_dtype)
+        with torch.no_grad(), autocast:
+            x = torch.from_numpy(np.ascontiguousarray(batch[:, np.newaxis], dtype=np.float32)).to(self._device())
+            logits = self.model(x)
+        return torch.sigmoid(logits.float())[:, 0].cpu().numpy()
+
+
+class OnnxPredictor(Predictor):
+    def __init__(self, model_path: Path) -> None:
+        import onnxruntime
+
+        self.session = onnxruntime.InferenceSession(str(model_path), providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        x = np.ascontiguousarray(batch[:, np.newaxis], dtype=np.float32)
+        logits = self.session.run(None, {self.input_name: x})[0]
+        return 1.0 / (1.0 + np.exp(-logits[:, 0]))
+
+
+def as_predictor(model) -> Predictor:
+    if isinstance(model, Predictor):
+        return model
+    return TorchPredictor(model)
+
+
+def _export_path(suffix: str) -> Path:
+    return _MODEL_DIR_.joinpath(f"{_MODEL_FILE_PATH_.stem}{suffix}")
+
+
+def _is_stale(export: Path) -> bool:
+    # exports follow the trained weights, rebuild them after every training run
+    if not export.exists():
+        return True
+    return _MODEL_FILE_PATH_.exists() and _MODEL_FILE_PATH_.stat().st_mtime > export.stat().st_mtime
+
+
+def _example_input(calibration: np.ndarray):
+    import torch
+    return torch.from_numpy(np.ascontiguousarray(calibration[:1, np.newaxis], dtype=np.float32))
+
+
+def _torchscript_model(model, calibration: np.ndarray):
+    import torch
+
+    export = _export_path('.ts')
+    if _is_stale(export):
+        model.eval()
+        with torch.no_grad():
+            traced = torch.jit.trace(model, _example_input(calibration))
+        export.parent.mkdir(parents=True, exist_ok=True)
+        torch.jit.save(traced, str(export))
+    return torch.jit.load(str(export), map_location='cpu')
+
+
+def _onnx_model_path(model, calibration: np.ndarray) -> Path:
+    import torch
+
+    export = _export_path('.onnx')
+    if _is_stale(export):
+        model.eval()
+        export.parent.mkdir(parents=True, exist_ok=True)
+        torch.onnx.export(model, _example_input(calibration), str(export),
+                          input_names=['image'], output_names=['logits'],
+                          dynamic_axes={'image': {0: 'batch', 2: 'height', 3: 'width'},
+                                        'logits': {0: 'batch', 2: 'height', 3: 'width'}})
+    return export
+
+
+def _int8_model(model, calibration: np.ndarray):
+    """
+    Static post-training int8 quantization (FX graph mode), calibrated on
+    ``calibration`` tiles. Dynamic quantization would only touch Linear
+    layers, the U-Net is convolutional.
+    """
+    import copy
+
+    import torch
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    float_model = copy.deepcopy(model).cpu().eval()
+    example = (_example_input(calibration),)
+    prepared = prepare_fx(float_model, get_default_qconfig_mapping('x86'), example)
+    with torch.no_grad():
+        for i in range(len(calibration)):
+            prepared(torch.from_numpy(np.ascontiguousarray(calibration[i:i + 1, np.newaxis], dtype=np.float32)))
+    return convert_fx(prepared)
+
+
+def get_predictor(backend: str, model, calibration: Optional[np.ndarray] = None):
+    """
+    Predictor for ``backend``, built once per model and cached for the
+    process. ``calibration`` tiles are needed for int8/TorchScript/ONNX.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', use one of {', '.join(BACKENDS)}")
+    if backend == 'float32':
+        return TorchPredictor(model)
+    if backend == 'bfloat16':
+        import torch
+        return TorchPredictor(model, autocast_dtype=torch.bfloat16)
+
+    key = (backend, id(model))
+    with _PREDICTOR_LOCK_:
+        if key not in _PREDICTOR_CACHE_:
+            if backend == 'int8':
+                predictor = TorchPredictor(_int8_model(model, calibration))
+            elif backend == 'torchscript':
+                predictor = TorchPredictor(_torchscript_model(model, calibration))
+            else:
+                predictor = OnnxPredictor(_onnx_model_path(model, calibration))
+            _PREDICTOR_CACHE_[key] = predictor
+        return _PREDICTOR_CACHE_[key]
+
+
+def clear_predictor_cache():
+    # called after training, the exported/quantized models are out of date
+    with _PREDICTOR_LOCK_:
+        _PREDICTOR_CACHE_.clear()
+
+
+def validate_predictor(predictor, reference, tiles: np.ndarray, min_iou: float = 0.95, threshold: float = 0.5) -> float:
+    """Mean mask IoU of ``predictor`` against ``reference`` on ``tiles``, raises if below ``min_iou``."""
+    from ._inference import mask_iou
+
+    iou = float(np.mean(mask_iou(reference(tiles) > threshold, predictor(tiles) > threshold)))
+    if iou < min_iou:
+        raise ValueError(f"Backend masks differ from float32: IoU {iou:.3f} < {min_iou:.3f}")
+    return iou
@@ -1,6 +1,4 @@
 import typing
-from PyQt5 import QtCore
-from PyQt5.QtWidgets import QWidget
 import napari
 from qtpy.QtCore import Signal
 from qtpy.QtWidgets import QWidget, QFormLayout, QComboBox, QVBoxLayout, QToolBar, QStyle,QSizePolicy
@@ -0,0 +1,137 @@
+"""
+Thread/process pool sizes for the whole pipeline.
+
+Values are read from ``~/.ml_particle_tracking/config.json`` and can be
+changed from the widgets. ``0`` means automatic: torch gets the cores that
+DataLoader workers leave free, step finding processes run with single
+threaded NumPy, and every pool is bounded by the cores this process may use.
+"""
+import contextlib
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+
+from ._model import _MODEL_DIR_
+
+_CONFIG_FILE_PATH_ = _MODEL_DIR_.joinpath('config.json')
+_THREAD_ENV_VARS_ = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+@dataclass
+class ParallelConfig:
+    torch_threads: int = 0
+    torch_interop_threads: int = 0
+    dataloader_workers: int = 0
+    dataloader_prefetch: int = 2
+    step_workers: int = 0
+    feature_workers: int = 0
+
+    def resolved_dataloader_workers(self) -> int:
+        return self.dataloader_workers or 0
+
+    def resolved_torch_threads(self, training: bool = False) -> int:
+        if self.torch_threads:
+            return self.torch_threads
+        busy = self.resolved_dataloader_workers() if training else 0
+        return max(1, available_cores() - busy)
+
+    def resolved_step_workers(self) -> int:
+        return min(self.step_workers or available_cores(), available_cores())
+
+    def resolved_feature_workers(self) -> int:
+        return min(self.feature_workers or available_cores(), available_cores())
+
+
+_CONFIG_ = None
+_CONFIG_LOCK_ = threading.Lock()
+
+
+def load_config(path: Path = _CONFIG_FILE_PATH_) -> ParallelConfig:
+    if not Path(path).exists():
+        return ParallelConfig()
+    with open(path) as f:
+        values = json.load(f)
+    known = {field.name for field in fields(ParallelConfig)}
+    return ParallelConfig(**{k: int(v) for k, v in values.items() if k in known})
+
+
+def save_config(config: ParallelConfig, path: Path = _CONFIG_FILE_PATH_) -> None:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(asdict(config), f, indent=2)
+
+
+def get_config() -> ParallelConfig:
+    """Process wide config, loaded from disk on first use."""
+    global _CONFIG_
+    with _CONFIG_LOCK_:
+        if _CONFIG_ is None:
+            _CONFIG_ = load_config()
+        return _CONFIG_
+
+
+def set_config(**values) -> ParallelConfig:
+    """Change the process wide config without writing it to disk."""
+    config = get_config()
+    for key, value in values.items():
+        setattr(config, key, int(value))
+    return config
+
+
+def update_config(**values) -> ParallelConfig:
+    config = set_config(**values)
+    save_config(config)
+    return config
+
+
+def apply_torch_threads(config: ParallelConfig = None, training: bool = False) -> None:
+    import torch
+
+    config = config or get_config()
+    torch.set_num_threads(config.resolved_torch_threads(training))
+    if config.torch_interop_threads:
+        # can only be set once, before any inter-op parallel work started
+        with contextlib.suppress(RuntimeError):
+            torch.set_num_interop_threads(config.torch_interop_threads)
+
+
+def configure_data_loader(loader, config: ParallelConfig = None):
+    """Same loader with the configured number of workers and prefetch factor."""
+    from torch.utils.data import DataLoader, RandomSampler
+
+    config = config or get_config()
+    workers = config.resolved_dataloader_workers()
+    if not workers and not getattr(loader, 'num_workers', 0):
+        return loader
+    kwargs = {'batch_size': loader.batch_size,
+              'shuffle': isinstance(loader.sampler, RandomSampler),
+              'drop_last': loader.drop_last,
+              'collate_fn': loader.collate_fn,
+              'num_workers': workers}
+    if workers:
+        kwargs.update(prefetch_factor=max(1, config.dataloader_prefetch), persistent_workers=True)
+    return DataLoader(loader.dataset, **kwargs)
+
+
+@contextlib.contextmanager
+def single_threaded_children():
+    """Child processes started inside the block run NumPy/BLAS with one thread."""
+    previous = {name: os.environ.get(name) for name in _THREAD_ENV_VARS_}
+    os.environ.update(dict.fromkeys(_THREAD_ENV_VARS_, '1'))
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
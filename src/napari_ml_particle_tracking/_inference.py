@@ -0,0 +1,174 @@
+"""
+Batched, tiled inference on top of ``particle_tracking.Model``.
+
+Frames are grouped into mini-batches and large frames are split into
+overlapping tiles, so one forward pass handles many frames/tiles at once.
+Overlapping tile predictions are averaged before thresholding.
+
+The per frame preprocessing and thresholding of ``Model.inference`` live in
+``_normalize`` and ``_binarize``. ``infer_frame`` runs them on one frame
+without tiling or batching and is the reference the batched path is tested
+against.
+"""
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+from ._backends import as_predictor
+
+# resnet encoders down-sample 5 times, the U-Net input must be a multiple of 32
+_ENCODER_STRIDE_ = 32
+_TILE_OVERLAP_ = 32
+# smaller tiles are mostly overlap and padding
+_MIN_TILE_SIZE_ = 128
+
+
+def frame_batches(n_frames: int, batch_size: int) -> Iterator[range]:
+    batch_size = max(1, int(batch_size))
+    for start in range(0, n_frames, batch_size):
+        yield range(start, min(start + batch_size, n_frames))
+
+
+def _tile_starts(length: int, tile_size: int, step: int) -> List[int]:
+    if length <= tile_size:
+        return [0]
+    starts = list(range(0, length - tile_size, step))
+    starts.append(length - tile_size)
+    return starts
+
+
+def tile_slices(frame_shape: Tuple[int, int], tile_size: int = 0, overlap: int = _TILE_OVERLAP_) -> List[Tuple[slice, slice]]:
+    """
+    (y, x) slices covering a frame with overlapping tiles of equal shape.
+
+    ``tile_size <= 0`` means no tiling, the whole frame is one tile. Smaller
+    tiles are raised to ``_MIN_TILE_SIZE_`` and the overlap is at most a
+    quarter of the tile size.
+    """
+    h, w = frame_shape
+    if tile_size > 0:
+        tile_size = max(tile_size, _MIN_TILE_SIZE_)
+    if tile_size <= 0 or (h <= tile_size and w <= tile_size):
+        return [(slice(0, h), slice(0, w))]
+
+    step = tile_size - min(overlap, tile_size // 4)
+    th, tw = min(h, tile_size), min(w, tile_size)
+    return [(slice(y, y + th), slice(x, x + tw))
+            for y in _tile_starts(h, tile_size, step)
+            for x in _tile_starts(w, tile_size, step)]
+
+
+def _normalize(frames: np.ndarray) -> np.ndarray:
+    # per frame min-max scaling to [0, 1], as Model.inference does
+    frames = frames.astype(np.float32, copy=True)
+    axes = tuple(range(1, frames.ndim))
+    f_min = frames.min(axis=axes, keepdims=True)
+    f_range = frames.max(axis=axes, keepdims=True) - f_min
+    f_range[f_range == 0] = 1
+    frames -= f_min
+    frames /= f_range
+    return frames
+
+
+def _binarize(probs: np.ndarray, threshold: float = 0.5) -> np.ndarray:
+    # sigmoid probabilities above the threshold are foreground, as in Model.inference
+    return (probs > threshold).astype(np.uint8)
+
+
+def _pad_to_stride(batch: np.ndarray) -> np.ndarray:
+    h, w = batch.shape[-2:]
+    pad_h = (-h) % _ENCODER_STRIDE_
+    pad_w = (-w) % _ENCODER_STRIDE_
+    if not (pad_h or pad_w):
+        return batch
+    return np.pad(batch, ((0, 0), (0, pad_h), (0, pad_w)), mode='edge')
+
+
+def forward_batch(model, batch: np.ndarray) -> np.ndarray:
+    """
+    Foreground probability for a ``(N, H, W)`` stack of normalized tiles.
+    ``model`` is the torch model or a predictor from ``_backends``.
+    """
+    h, w = batch.shape[-2:]
+    padded = np.ascontiguousarray(_pad_to_stride(batch))
+    return as_predictor(model)(padded)[:, :h, :w]
+
+
+def infer_frame(model, frame: np.ndarray, threshold: float = 0.5) -> np.ndarray:
+    """Mask of a single ``(H, W)`` frame, one forward pass without tiling."""
+    frames = _normalize(np.asarray(frame)[np.newaxis])
+    return _binarize(forward_batch(model, frames), threshold)[0]
+
+
+def sample_tiles(image_data, tile_size: int = 0, overlap: int = _TILE_OVERLAP_, n_frames: int = 4) -> np.ndarray:
+    """Normalized, stride padded tiles of the first frames, for calibration/validation of backends."""
+    slices = tile_slices(image_data.shape[-2:], tile_size, overlap)
+    frames = _normalize(np.asarray(image_data[:max(1, n_frames)]))
+    tiles = np.stack([frame[ys, xs] for frame in frames for ys, xs in slices])
+    return np.ascontiguousarray(_pad_to_stride(tiles))
+
+
+def predict_frames(model, frames: np.ndarray, slices: List[Tuple[slice, slice]], batch_size: int = 8, threshold: float = 0.5) -> np.ndarray:
+    """Masks for a ``(N, H, W)`` block of frames, tiles are stitched back by averaging."""
+    frames = _normalize(frames)
+    tiles = np.stack([frame[ys, xs] for frame in frames for ys, xs in slices])
+    probs = np.concatenate([forward_batch(model, tiles[i:i + batch_size])
+                            for i in range(0, len(tiles), batch_size)])
+
+    prob_sum = np.zeros(frames.shape, dtype=np.float32)
+    counts = np.zeros(frames.shape[-2:], dtype=np.float32)
+    for ys, xs in slices:
+        counts[ys, xs] += 1
+
+    k = 0
+    for f in range(len(frames)):
+        for ys, xs in slices:
+            prob_sum[f, ys, xs] += probs[k]
+            k += 1
+
+    prob_sum /= counts
+    return _binarize(prob_sum, threshold)
+
+
+def frames_per_batch(frame_shape: Tuple[int, int], batch_size: int = 8, tile_size: int = 0, overlap: int = _TILE_OVERLAP_) -> int:
+    """Number of frames read per forward pass, at least one."""
+    return max(1, batch_size // len(tile_slices(frame_shape, tile_size, overlap)))
+
+
+def infer_batches(model, image_data, batch_size: int = 8, tile_size: int = 0, overlap: int = _TILE_OVERLAP_, threshold: float = 0.5) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Run inference over a ``(T, H, W)`` stack.
+
+    ``batch_size`` is the number of tiles per forward pass; frames are grouped
+    so that their tiles fill the batch. Yields ``(first_frame, masks)``.
+    ``image_data`` can be any lazily sliceable array (dask, zarr, memmap),
+    only one batch of frames is read into memory at a time.
+    """
+    slices = tile_slices(image_data.shape[-2:], tile_size, overlap)
+    predictor = as_predictor(model)
+    n_frames = frames_per_batch(image_data.shape[-2:], batch_size, tile_size, overlap)
+    for frame_range in frame_batches(image_data.shape[0], n_frames):
+        frames = np.asarray(image_data[frame_range.start:frame_range.stop])
+        yield frame_range.start, predict_frames(predictor, frames, slices, batch_size, threshold)
+
+
+def infer_frames(model, image_data, indices, batch_size: int = 8, tile_size: int = 0, overlap: int = _TILE_OVERLAP_, threshold: float = 0.5) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Like ``infer_batches`` for a subset of frames, yields ``(frame_indices, masks)``."""
+    indices = np.asarray(sorted(indices), dtype=int)
+    slices = tile_slices(image_data.shape[-2:], tile_size, overlap)
+    predictor = as_predictor(model)
+    n_frames = frames_per_batch(image_data.shape[-2:], batch_size, tile_size, overlap)
+    for frame_range in frame_batches(len(indices), n_frames):
+        batch_indices = indices[frame_range.start:frame_range.stop]
+        frames = np.stack([np.asarray(image_data[i]) for i in batch_indices])
+        yield batch_indices, predict_frames(predictor, frames, slices, batch_size, threshold)
+
+
+def mask_iou(old: np.ndarray, new: np.ndarray) -> np.ndarray:
+    """Per frame IoU of two ``(N, H, W)`` mask stacks, two empty frames count as 1."""
+    old = np.asarray(old) > 0
+    new = np.asarray(new) > 0
+    axes = tuple(range(1, old.ndim))
+    intersection = np.logical_and(old, new).sum(axis=axes)
+    union = np.logical_or(old, new).sum(axis=axes)
+    return np.where(union > 0, intersection / np.maximum(union, 1), 1.0)
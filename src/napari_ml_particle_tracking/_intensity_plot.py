@@ -1,5 +1,3 @@
-from PyQt5 import QtCore
-from PyQt5.QtWidgets import QWidget
 from napari_matplotlib.base import BaseNapariMPLWidget
 import napari
 from qtpy.QtWidgets import QWidget, QVBoxLayout, QPushButton
@@ -8,6 +6,7 @@ import matplotlib
 import matplotlib.style as mplstyle
 import numpy as np
 from ._base_widget import NapariLayersWidget,BaseWidget
+from ._steps import detect_steps
 from dataclasses import dataclass
 
 # https://davidmathlogic.com/colorblind #  IBM Design Library
@@ -31,6 +30,7 @@ class IntensityPlotWidget(BaseNapariMPLWidget):
         # self._setup_callbacks()
         self.add_single_axes()
         self.data = []
+        self.steps = []
         self.label = None
         self.color = None
 
@@ -71,11 +71,25 @@ class IntensityPlotWidget(BaseNapariMPLWidget):
             else:   
                 x = np.arange(len(self.data))
                 self.axes.plot(x, self.data, label =label, color=color)
+                if len(self.steps):
+                    self.axes.plot(x, self.steps, label="steps", color=colors['COLOR_2'])
                 self.axes.legend()
 
         # needed
         self.canvas.draw()
 
+    def set_intensity(self, intensity) -> None:
+        """Plot a new trace, the step fit of the previous one is dropped."""
+        self.steps = []
+        self.clear()
+        self.draw(np.asarray(intensity), "intensity", colors['COLOR_1'])
+
+    def set_steps(self, fit) -> None:
+        """Overlay a step fit on the current trace."""
+        self.steps = fit
+        self.clear()
+        self.draw(self.data, self.label, self.color)
+
 
 class StepFinderWidget(BaseWidget):
     def __init__(self, napari_viewer : napari.viewer.Viewer, parent:QWidget=None) -> None:
@@ -89,9 +103,9 @@ class StepFinderWidget(BaseWidget):
         self.intensity = []
 
     def set_track(self, track):
-        from particle_tracking.utils import Track
+        # {column: values} slice of a TrackIndex, ordered by frame
         self.track = track
-        self.set_intensity(track.to_list_by_key('intensity_mean'))
+        self.set_intensity(track['intensity_mean'])
 
         
     def set_intensity(self, intensity):
@@ -101,27 +115,5 @@ class StepFinderWidget(BaseWidget):
     def detect_steps(self):
         if not len(self.intensity):
             return
-        dataX = np.array(self.intensity)
-        FitX = 0 * dataX
-
-        # multipass:
-        for ii in range(0, 3, 1):
-            # work remaining part of data:
-            residuX = dataX - FitX
-            newFitX, _, _, S_curve, best_shot = core.stepfindcore(
-                residuX, 0.1
-            )
-            FitX = st.AppendFitX(newFitX, FitX, dataX)
-            # storage for plotting:
-            if ii == 0:
-                Fits = np.copy(FitX)
-                S_curves = np.copy(S_curve)
-                best_shots = [best_shot]
-            elif best_shot > 0:
-                Fits = np.vstack([Fits, FitX])
-                S_curves = np.vstack([S_curves, S_curve])
-                best_shots = np.hstack([best_shots, best_shot])
-
-        # steps from final fit:
-        # steptable = st.Fit2Steps(dataX, FitX)
+        FitX, _ = detect_steps(self.intensity)
         self.intensity_plot.set_steps(list(FitX))
\ No newline at end of file
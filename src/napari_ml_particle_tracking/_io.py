@@ -0,0 +1,156 @@
+"""
+File/storage helpers shared by the widgets.
+"""
+from pathlib import Path
+from typing import Iterator, Tuple, Union
+
+import numpy as np
+
+
+def create_mask_store(path: Union[str, Path], shape: Tuple[int, ...], chunk_frames: int = 16, dtype=np.uint8):
+    """
+    Chunked on-disk zarr array for a ``(T, H, W)`` mask, one chunk per
+    ``chunk_frames`` frames. The returned array can be written frame range by
+    frame range and handed to napari as a lazy Labels layer.
+    """
+    try:
+        import zarr
+    except ImportError as e:
+        raise ImportError("Streaming segmentation requires 'zarr', install it with 'pip install zarr'.") from e
+
+    chunks = (max(1, int(chunk_frames)),) + tuple(shape[1:])
+    return zarr.open(str(path), mode='w', shape=tuple(shape), chunks=chunks, dtype=dtype, fill_value=0)
+
+
+def is_mask_store(data) -> bool:
+    """True for a writable zarr array, e.g. one made by ``create_mask_store``."""
+    return type(data).__module__.split('.')[0] == 'zarr' and not getattr(data, 'read_only', True)
+
+
+MASK_FILE_FILTER = "Mask (*.tif *.tiff *.zarr);;TIFF (*.tif *.tiff);;Zarr (*.zarr)"
+
+
+def _mask_chunks(mask_data, chunk_frames: int, dtype):
+    for start in range(0, mask_data.shape[0], chunk_frames):
+        # astype(copy=False) is a no-op when the dtype already matches
+        yield start, np.asarray(mask_data[start:start + chunk_frames]).astype(dtype, copy=False)
+
+
+def iter_write_mask(path: Union[str, Path], mask_data, chunk_frames: int = 64, dtype=np.uint8, compression: str = 'zlib') -> Iterator[int]:
+    """
+    Write a ``(T, H, W)`` mask chunk by chunk with lossless compression,
+    to a TIFF (one page per frame) or a chunked zarr store depending on the
+    extension. Yields the number of frames written after every chunk.
+    """
+    path = Path(path)
+    chunk_frames = max(1, int(chunk_frames))
+    if path.suffix.lower() == '.zarr':
+        store = create_mask_store(path, mask_data.shape, chunk_frames=chunk_frames, dtype=dtype)
+        for start, chunk in _mask_chunks(mask_data, chunk_frames, dtype):
+            store[start:start + len(chunk)] = chunk
+            yield len(chunk)
+        return
+
+    import tifffile
+
+    # one compressed page per frame, without shaped metadata readers see a (T, H, W) series
+    with tifffile.TiffWriter(path, bigtiff=True) as tif:
+        for _, chunk in _mask_chunks(mask_data, chunk_frames, dtype):
+            for frame in chunk:
+                tif.write(frame, compression=compression, photometric='minisblack', metadata=None)
+            yield len(chunk)
+
+
+# tracks
+
+TRACK_FILE_FILTER = "Tracks (*.csv *.parquet *.feather);;CSV (*.csv);;Parquet (*.parquet);;Feather (*.feather)"
+TRACK_COLUMNS = ['particle', 'frame', 'y', 'x', 'intensity_mean']
+_TRACK_FORMATS_ = ('.csv', '.parquet', '.feather')
+
+
+def _track_format(path: Path) -> str:
+    suffix = Path(path).suffix.lower()
+    if suffix not in _TRACK_FORMATS_:
+        raise ValueError(f"Unsupported track file '{path}', use one of {', '.join(_TRACK_FORMATS_)}")
+    return suffix
+
+
+def sibling_path(path: Union[str, Path], table: str) -> Path:
+    """``tracks.parquet`` -> ``tracks.<table>.parquet``"""
+    path = Path(path)
+    return path.with_name(f"{path.stem}.{table}{path.suffix}")
+
+
+def track_file_columns(path: Union[str, Path]) -> list:
+    """Column names stored in a track file, without reading the data."""
+    suffix = _track_format(path)
+    if suffix == '.parquet':
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(str(path)).names)
+    if suffix == '.feather':
+        import pyarrow.ipc as ipc
+        with ipc.open_file(str(path)) as reader:
+            return list(reader.schema.names)
+    import pandas as pd
+    return list(pd.read_csv(path, sep=',', nrows=0).columns)
+
+
+def read_table(path: Union[str, Path], columns=None):
+    """Read a csv/parquet/feather table, ``columns`` limits what is read from disk."""
+    import pandas as pd
+
+    suffix = _track_format(path)
+    if columns is not None:
+        available = track_file_columns(path)
+        columns = [col for col in columns if col in available]
+    if suffix == '.parquet':
+        df = pd.read_parquet(path, columns=columns)
+    elif suffix == '.feather':
+        df = pd.read_feather(path, columns=columns)
+    else:
+        # round_trip reads back exactly the floats that were written
+        df = pd.read_csv(path, sep=',', usecols=columns, float_precision='round_trip')
+    # older csv files were saved together with the pandas index
+    return df.drop(columns=['Unnamed: 0'], errors='ignore')
+
+
+def write_table(path: Union[str, Path], df) -> None:
+    suffix = _track_format(path)
+    df = df.reset_index(drop=True)
+    if suffix != '.csv':
+        # arrow formats need string column names, step tables use integer ones
+        df.columns = [str(col) for col in df.columns]
+    if suffix == '.parquet':
+        df.to_parquet(path, index=False)
+    elif suffix == '.feather':
+        df.to_feather(path)
+    else:
+        df.to_csv(path, sep=',', index=False)
+
+
+def read_tracks(path: Union[str, Path], columns=None):
+    """
+    Tracks plus the ``steps`` and ``meta`` tables saved next to them.
+    Missing side tables are returned as ``None``.
+    """
+    tracks = read_table(path, columns=columns)
+    steps = sibling_path(path, 'steps')
+    meta = sibling_path(path, 'meta')
+    return (tracks,
+            _step_table_columns(read_table(steps)) if steps.exists() else None,
+            read_table(meta) if meta.exists() else None)
+
+
+def _step_table_columns(steps):
+    # step tables use integer column names, files store them as strings
+    steps.columns = [int(col) if str(col).isdigit() else col for col in steps.columns]
+    return steps
+
+
+def write_tracks(path: Union[str, Path], tracks, steps=None, meta=None) -> None:
+    """Save tracks, non-empty ``steps``/``meta`` tables go to sibling files in the same format."""
+    write_table(path, tracks)
+    if steps is not None and not steps.empty:
+        write_table(sibling_path(path, 'steps'), steps)
+    if meta is not None and not meta.empty:
+        write_table(sibling_path(path, 'meta'), meta)
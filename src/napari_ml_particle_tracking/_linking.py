@@ -0,0 +1,110 @@
+"""
+Linking of per-frame detections into tracks.
+
+The default backend is a streaming KD-tree linker: every frame only the
+detections within ``search_range`` of an active track are considered, so
+the cost grows with the number of detections instead of quadratically.
+``trackpy`` can be used instead when it is installed.
+"""
+from typing import Callable, Dict, Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+
+class KDTreeLinker:
+    """
+    Frame by frame nearest-neighbour linker.
+
+    Candidate pairs within ``search_range`` are found with a KD-tree and
+    assigned greedily by increasing distance. A track that is not matched
+    stays linkable for ``memory`` frames.
+    """
+    def __init__(self, search_range: float, memory: int = 0, pos_columns=('y', 'x')) -> None:
+        self.search_range = search_range
+        self.memory = memory
+        self.pos_columns = list(pos_columns)
+        self.next_id = 0
+        self.track_ids = np.zeros(0, dtype=np.int64)
+        self.track_pos = np.zeros((0, len(self.pos_columns)))
+        self.track_frame = np.zeros(0, dtype=np.int64)
+
+    def link_frame(self, frame: int, positions: np.ndarray) -> np.ndarray:
+        """Track ids for the ``(N, ndim)`` detections of ``frame``."""
+        from scipy.spatial import cKDTree
+
+        positions = np.asarray(positions, dtype=float).reshape(-1, len(self.pos_columns))
+        ids = np.full(len(positions), -1, dtype=np.int64)
+        # frames without detections never reach link_frame, so expire
+        # tracks by their gap to this frame before matching
+        self._forget((frame - self.track_frame) <= self.memory + 1)
+
+        if len(positions) and len(self.track_ids):
+            pairs = cKDTree(positions).sparse_distance_matrix(
+                cKDTree(self.track_pos), self.search_range, output_type='ndarray')
+            if len(pairs):
+                pairs = pairs[np.argsort(pairs['v'], kind='stable')]
+                track_used = np.zeros(len(self.track_ids), dtype=bool)
+                matched_det, matched_trk = [], []
+                for det, trk in zip(pairs['i'].tolist(), pairs['j'].tolist()):
+                    if ids[det] < 0 and not track_used[trk]:
+                        ids[det] = self.track_ids[trk]
+                        track_used[trk] = True
+                        matched_det.append(det)
+                        matched_trk.append(trk)
+                self.track_pos[matched_trk] = positions[matched_det]
+                self.track_frame[matched_trk] = frame
+
+        new = ids < 0
+        n_new = int(new.sum())
+        ids[new] = np.arange(self.next_id, self.next_id + n_new)
+        self.next_id += n_new
+
+        # forget tracks that were not seen for more than memory frames
+        self._forget((frame - self.track_frame) <= self.memory)
+        self.track_ids = np.concatenate([self.track_ids, ids[new]])
+        self.track_pos = np.concatenate([self.track_pos, positions[new]])
+        self.track_frame = np.concatenate([self.track_frame, np.full(n_new, frame, dtype=np.int64)])
+        return ids
+
+    def _forget(self, alive: np.ndarray) -> None:
+        self.track_ids = self.track_ids[alive]
+        self.track_pos = self.track_pos[alive]
+        self.track_frame = self.track_frame[alive]
+
+    def link_df_iter(self, features: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        for frame_df in features:
+            if not len(frame_df):
+                continue
+            frame_df = frame_df.copy()
+            frame = int(frame_df['frame'].iloc[0])
+            frame_df['particle'] = self.link_frame(frame, frame_df[self.pos_columns].to_numpy())
+            yield frame_df
+
+
+def _link_kdtree(features, search_range, memory):
+    return KDTreeLinker(search_range, memory).link_df_iter(features)
+
+
+def _link_trackpy(features, search_range, memory):
+    import trackpy
+    return trackpy.link_df_iter(features, search_range, memory=memory)
+
+
+LINKERS: Dict[str, Callable] = {
+    'kdtree': _link_kdtree,
+    'trackpy': _link_trackpy,
+}
+
+
+def link_iter(features: Iterable[pd.DataFrame], search_range: float, memory: int = 0, backend: str = 'kdtree') -> Iterator[pd.DataFrame]:
+    """Link a stream of per-frame feature tables, yields them with a ``particle`` column."""
+    return LINKERS[backend](features, search_range, memory)
+
+
+def link(features: pd.DataFrame, search_range: float, memory: int = 0, backend: str = 'kdtree') -> pd.DataFrame:
+    frames = (frame_df for _, frame_df in features.groupby('frame', sort=True))
+    linked = list(link_iter(frames, search_range, memory, backend))
+    if not linked:
+        return features.assign(particle=np.zeros(0, dtype=np.int64))
+    return pd.concat(linked, ignore_index=True)
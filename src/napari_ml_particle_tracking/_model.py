@@ -0,0 +1,83 @@
+"""
+Process wide, lazily constructed segmentation model.
+
+The model (and torch/particle_tracking with it) is only imported and built
+on first use, and all widgets share the same instance. Pretrained encoder
+weights are only looked up in the local ``~/.ml_particle_tracking`` cache,
+nothing is downloaded.
+"""
+import threading
+import warnings
+from pathlib import Path
+from typing import Optional
+
+_MODEL_FILE_NAME_ = 'model_final.pt'
+_MODEL_DIR_ = Path.home().joinpath('.ml_particle_tracking')
+_MODEL_FILE_PATH_ = _MODEL_DIR_.joinpath(_MODEL_FILE_NAME_)
+# torch hub layout, imagenet encoder weights go to <hub>/checkpoints/<file>
+_HUB_DIR_ = _MODEL_DIR_.joinpath('hub')
+_ENCODER_NAME_ = 'resnet18'
+# file names of the segmentation_models_pytorch imagenet weight urls
+_ENCODER_WEIGHT_FILES_ = {'resnet18': 'resnet18-5c106cde.pth'}
+
+_MODEL_CACHE_ = {}
+_MODEL_LOCK_ = threading.Lock()
+
+
+def cached_encoder_weights(encoder_name: str = _ENCODER_NAME_) -> Optional[Path]:
+    """Cached imagenet weights of ``encoder_name``, the file torch hub would download."""
+    file_name = _ENCODER_WEIGHT_FILES_.get(encoder_name)
+    if file_name is None:
+        return None
+    path = _HUB_DIR_.joinpath('checkpoints', file_name)
+    return path if path.exists() else None
+
+
+def _encoder_weights(model_path: Path):
+    # trained weights replace the encoder initialisation anyway
+    if Path(model_path).exists():
+        return None
+    if cached_encoder_weights() is not None:
+        return "imagenet"
+    warnings.warn(f"No '{_ENCODER_NAME_}' imagenet weights in {_HUB_DIR_}, using a randomly initialised encoder",
+                  stacklevel=2)
+    return None
+
+
+def _load_model(model_path: Path):
+    import torch
+    from particle_tracking import Model
+    from torch import nn, optim
+
+    # keep torch hub lookups inside the local cache while the encoder is built,
+    # the hub directory is process wide and may be used by other packages
+    hub_dir = torch.hub.get_dir()
+    torch.hub.set_dir(str(_HUB_DIR_))
+    try:
+        return Model(
+                    pre_trained_model_path=model_path,
+                    optimizerCls=optim.Adam,
+                    learning_rate = 1.e-4,
+                    loss_fn=nn.BCEWithLogitsLoss(),
+                    encoder_name=_ENCODER_NAME_,
+                    encoder_weights=_encoder_weights(model_path),
+                    in_channels = 1,
+                    classes=1,
+                    is_inference_mode=True
+                )
+    finally:
+        torch.hub.set_dir(hub_dir)
+
+
+def get_model(model_path: Path = _MODEL_FILE_PATH_):
+    """Shared model for ``model_path``, built on the first call."""
+    key = str(model_path)
+    with _MODEL_LOCK_:
+        if key not in _MODEL_CACHE_:
+            _MODEL_CACHE_[key] = _load_model(model_path)
+        return _MODEL_CACHE_[key]
+
+
+def clear_model_cache():
+    with _MODEL_LOCK_:
+        _MODEL_CACHE_.clear()
@@ -0,0 +1,376 @@
+"""
+Headless segment -> features -> link -> steps pipeline.
+
+The stage functions are what the widgets run, ``run_movie`` chains them for
+one TIFF stack and ``run_batch`` runs a directory of stacks on a process
+pool. Every stage writes its output into ``<output>/<movie stem>/`` and is
+skipped on the next run when that output is newer than its input and was
+made with the same parameters, so an interrupted batch resumes where it
+stopped. ``main`` is the ``ml-particle-tracking`` console entry point.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import (
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import numpy as np
+import pandas as pd
+
+from ._config import apply_torch_threads, available_cores, get_config
+from ._features import _FEATURE_COLUMNS_, extract_features, iter_frame_features
+from ._inference import infer_batches, sample_tiles
+from ._io import iter_write_mask, read_table, sibling_path, write_table
+from ._linking import LINKERS, link, link_iter
+from ._step_cache import StepCache
+from ._steps import analyse_tracks
+from ._tracks import TrackIndex, tracks_frame_count_meta
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('segment', 'features', 'link', 'steps')
+# parameters whose change invalidates the output of a stage
+_STAGE_PARAMS_ = {
+    'segment': ('tile_size', 'backend', 'min_iou', 'threshold'),
+    'features': (),
+    'link': ('search_range', 'memory', 'linker'),
+    'steps': (),
+}
+_STATE_FILE_NAME_ = 'stages.json'
+_SUMMARY_FILE_NAME_ = 'summary.json'
+
+
+@dataclass
+class PipelineParams:
+    batch_size: int = 8
+    tile_size: int = 0
+    backend: str = 'float32'
+    min_iou: float = 0.95
+    threshold: float = 0.5
+    search_range: float = 2.0
+    memory: int = 1
+    linker: str = 'kdtree'
+    table_format: str = '.csv'
+
+
+# stages, shared with the widgets
+
+def inference_predictor(image_data, tile_size=0, backend='float32', min_iou=0.95):
+    """
+    Shared model wrapped in the requested backend. A backend that fails to
+    build or whose masks drift below ``min_iou`` of float32 falls back to
+    float32 with a warning.
+    """
+    from ._backends import get_predictor, validate_predictor
+    from ._model import get_model
+
+    # the first run builds the shared model here, off the UI thread
+    model = get_model()
+    apply_torch_threads()
+    reference = get_predictor('float32', model)
+    if backend == 'float32':
+        return reference
+    tiles = sample_tiles(image_data, tile_size)
+    try:
+        predictor = get_predictor(backend, model, tiles)
+        iou = validate_predictor(predictor, reference, tiles, min_iou)
+    except Exception as e:  # noqa: BLE001 tracing/export/quantization fail in many ways
+        warnings.warn(f"'{backend}' inference backend not used, falling back to float32: {e}", stacklevel=2)
+        return reference
+    logger.info("'%s' inference backend, IoU against float32: %.3f", backend, iou)
+    return predictor
+
+
+def iter_segment(image_data, mask, batch_size=8, tile_size=0, backend='float32', min_iou=0.95,
+                 threshold=0.5) -> Iterator[Tuple[int, int]]:
+    """Writes masks into ``mask`` in place, yields ``(first_frame, n_frames)`` per batch."""
+    model = inference_predictor(image_data, tile_size, backend, min_iou)
+    for start, masks in infer_batches(model, image_data, batch_size=batch_size, tile_size=tile_size, threshold=threshold):
+        mask[start:start + len(masks)] = masks
+        yield start, len(masks)
+
+
+def track_stack(mask_data, image_data, search_range: float, memory: int = 0, linker: str = 'kdtree',
+                n_workers: Optional[int] = None, callback: Optional[Callable[[int], None]] = None) -> pd.DataFrame:
+    """
+    Measure the frames of ``mask_data`` and link them as a stream, only a
+    few frames are in memory at once. ``callback`` is called with 1 after
+    every frame.
+    """
+    features = iter_frame_features(mask_data, image_data, n_workers=n_workers)
+    if callback is not None:
+        features = _counted(features, callback)
+    linked = list(link_iter(features, search_range, memory, linker))
+    if not linked:
+        return pd.DataFrame(columns=_FEATURE_COLUMNS_ + ['particle'])
+    return pd.concat(linked, ignore_index=True)
+
+
+def _counted(items: Iterable, callback: Callable[[int], None]) -> Iterator:
+    for item in items:
+        yield item
+        callback(1)
+
+
+def find_steps(track_index: TrackIndex, track_ids: Optional[Sequence] = None, n_workers: Optional[int] = None,
+               callback: Optional[Callable[[int], None]] = None, cache: Optional[StepCache] = None) -> Tuple[pd.DataFrame, pd.Series]:
+    """Steps table and step count per track of the intensity traces of ``track_ids`` (all tracks by default)."""
+    return analyse_tracks(track_index.traces(track_ids), n_workers=n_workers, callback=callback, cache=cache)
+
+
+def track_meta(tracked_df: pd.DataFrame, step_count: Optional[pd.Series] = None) -> pd.DataFrame:
+    meta = tracks_frame_count_meta(tracked_df, track_id_col='particle', frame_col='frame')
+    if step_count is not None:
+        meta['step_count'] = meta['particle'].map(step_count)
+    return meta
+
+
+# one movie
+
+def _partial_path(path: Path) -> Path:
+    # keep the suffix, the writers pick the format from it
+    return path.with_name(f"{path.stem}.partial{path.suffix}")
+
+
+def _write_table_atomic(path: Path, df: pd.DataFrame) -> None:
+    partial = _partial_path(path)
+    write_table(partial, df)
+    os.replace(partial, path)
+
+
+class MovieRun:
+    """Output paths and per-stage bookkeeping of one movie."""
+    def __init__(self, movie: Path, output_dir: Path, params: PipelineParams) -> None:
+        self.movie = Path(movie)
+        self.params = params
+        self.dir = Path(output_dir).joinpath(self.movie.stem)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.state_path = self.dir.joinpath(_STATE_FILE_NAME_)
+        self.state = json.loads(self.state_path.read_text()) if self.state_path.exists() else {}
+        suffix = params.table_format
+        self.outputs = {
+            'segment': self.dir.joinpath('mask.tif'),
+            'features': self.dir.joinpath(f"features{suffix}"),
+            'link': self.dir.joinpath(f"tracks{suffix}"),
+            # meta is always written by the steps stage, the steps table may be empty
+            'steps': sibling_path(self.dir.joinpath(f"tracks{suffix}"), 'meta'),
+        }
+
+    def stage_params(self, stage: str) -> dict:
+        return {name: getattr(self.params, name) for name in _STAGE_PARAMS_[stage]}
+
+    def stage_input(self, stage: str) -> Path:
+        index = STAGES.index(stage)
+        return self.movie if index == 0 else self.outputs[STAGES[index - 1]]
+
+    def is_done(self, stage: str) -> bool:
+        output = self.outputs[stage]
+        source = self.stage_input(stage)
+        if not output.exists() or stage not in self.state:
+            return False
+        if source.exists() and source.stat().st_mtime > output.stat().st_mtime:
+            return False
+        return self.state[stage].get('params') == self.stage_params(stage)
+
+    def record(self, stage: str, units: int, seconds: float) -> dict:
+        self.state[stage] = {'params': self.stage_params(stage), 'units': int(units), 'seconds': seconds}
+        self.state_path.write_text(json.dumps(self.state, indent=2))
+        return self.state[stage]
+
+
+def _read_movie(path: Path):
+    import tifffile
+    data = tifffile.imread(str(path))
+    # a single frame is a one frame movie
+    return data[np.newaxis] if data.ndim == 2 else data
+
+
+def run_movie(movie, output_dir, params: Optional[PipelineParams] = None, stages: Sequence[str] = STAGES,
+              overwrite: bool = False, threads: Optional[int] = None, step_workers: Optional[int] = None) -> dict:
+    """
+    Run ``stages`` for one TIFF stack, returns ``{movie, stages: {stage: {units,
+    seconds, skipped}}}``. ``threads`` bounds torch and feature extraction,
+    ``step_workers`` the step finding pool, the config defaults are used when
+    they are None. A failing stage stops the movie, its traceback is
+    returned under ``error``.
+    """
+    params = params or PipelineParams()
+    run = MovieRun(movie, output_dir, params)
+    result = {'movie': str(run.movie), 'stages': {}}
+    image_data = mask = tracks = None
+
+    def image():
+        nonlocal image_data
+        if image_data is None:
+            image_data = _read_movie(run.movie)
+        return image_data
+
+    if threads:
+        # movie processes of a batch share the cores, not saved to the config file
+        config = get_config()
+        config.torch_threads = config.feature_workers = threads
+
+    try:
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            if not overwrite and run.is_done(stage):
+                result['stages'][stage] = dict(run.state[stage], skipped=True)
+                continue
+            if not run.stage_input(stage).exists():
+                raise FileNotFoundError(f"'{stage}' needs {run.stage_input(stage)}, run the '{STAGES[STAGES.index(stage) - 1]}' stage first")
+
+            start = time.perf_counter()
+            if stage == 'segment':
+                mask = np.zeros(image().shape, dtype=np.uint8)
+                for _ in iter_segment(image(), mask, batch_size=params.batch_size, tile_size=params.tile_size,
+                                      backend=params.backend, min_iou=params.min_iou, threshold=params.threshold):
+                    pass
+                partial = _partial_path(run.outputs[stage])
+                for _ in iter_write_mask(partial, mask):
+                    pass
+                os.replace(partial, run.outputs[stage])
+                units = mask.shape[0]
+            elif stage == 'features':
+                if mask is None:
+                    mask = _read_movie(run.outputs['segment'])
+                features = extract_features(mask, image())
+                _write_table_atomic(run.outputs[stage], features)
+                units = mask.shape[0]
+            elif stage == 'link':
+                features = read_table(run.outputs['features'])
+                tracks = link(features, params.search_range, params.memory, params.linker)
+                _write_table_atomic(run.outputs[stage], tracks)
+                units = features['frame'].nunique()
+            else:
+                if tracks is None:
+                    tracks = read_table(run.outputs['link'])
+                steps_info, step_count = find_steps(TrackIndex(tracks), n_workers=step_workers)
+                _write_table_atomic(sibling_path(run.outputs['link'], 'steps'), steps_info)
+                _write_table_atomic(run.outputs[stage], track_meta(tracks, step_count))
+                units = len(step_count)
+            result['stages'][stage] = dict(run.record(stage, units, time.perf_counter() - start), skipped=False)
+    except Exception:  # noqa: BLE001 one broken movie should not stop the batch
+        result['error'] = traceback.format_exc()
+    return result
+
+
+# many movies
+
+def find_movies(input_dir, pattern: str = '*.tif*') -> List[Path]:
+    return sorted(path for path in Path(input_dir).glob(pattern) if path.is_file())
+
+
+def run_batch(movies: Sequence, output_dir, params: Optional[PipelineParams] = None, stages: Sequence[str] = STAGES,
+              n_workers: int = 1, overwrite: bool = False, callback: Optional[Callable[[dict], None]] = None) -> List[dict]:
+    """
+    Run the pipeline for every movie, ``n_workers`` movies at a time. The
+    cores are split between the movie processes, each runs its step
+    finding serially. ``callback`` gets every movie result as it finishes.
+    """
+    params = params or PipelineParams()
+    movies = [Path(movie) for movie in movies]
+    n_workers = max(1, min(n_workers, len(movies)))
+    results = []
+    if n_workers == 1:
+        for movie in movies:
+            results.append(run_movie(movie, output_dir, params, stages, overwrite, None, None))
+            if callback is not None:
+                callback(results[-1])
+        return results
+
+    threads = max(1, available_cores() // n_workers)
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as executor:
+        futures = [executor.submit(run_movie, movie, output_dir, params, stages, overwrite, threads, 1)
+                   for movie in movies]
+        for future in as_completed(futures):
+            results.append(future.result())
+            if callback is not None:
+                callback(results[-1])
+    return sorted(results, key=lambda result: result['movie'])
+
+
+_STAGE_UNITS_ = {'segment': 'frames', 'features': 'frames', 'link': 'frames', 'steps': 'tracks'}
+
+
+def summarize(results: Sequence[dict]) -> pd.DataFrame:
+    """Throughput per stage over the stages that ran in this batch, skipped ones are only counted."""
+    rows = []
+    for stage in STAGES:
+        ran = [r['stages'][stage] for r in results if stage in r['stages'] and not r['stages'][stage]['skipped']]
+        skipped = sum(1 for r in results if stage in r['stages'] and r['stages'][stage]['skipped'])
+        units = sum(s['units'] for s in ran)
+        seconds = sum(s['seconds'] for s in ran)
+        rows.append({'stage': stage, 'movies': len(ran), 'skipped': skipped, 'units': units,
+                     'unit': _STAGE_UNITS_[stage], 'seconds': seconds,
+                     'per_second': units / seconds if seconds else np.nan})
+    return pd.DataFrame(rows)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='ml-particle-tracking', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input_dir', type=Path, help="directory of TIFF stacks")
+    parser.add_argument('output_dir', type=Path, help="one sub-directory per movie is created here")
+    parser.add_argument('--pattern', default='*.tif*', help="movie file pattern (default: %(default)s)")
+    parser.add_argument('--stages', default=','.join(STAGES), help="comma separated stages (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=1, help="movies processed in parallel (default: %(default)s)")
+    parser.add_argument('--overwrite', action='store_true', help="re-run stages that already have an output")
+    defaults = PipelineParams()
+    for field in fields(PipelineParams):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=type(getattr(defaults, field.name)),
+                            default=getattr(defaults, field.name), help="(default: %(default)s)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages {', '.join(unknown)}, use {', '.join(STAGES)}")
+    if args.linker not in LINKERS:
+        parser.error(f"unknown linker '{args.linker}', use {', '.join(LINKERS)}")
+    params = PipelineParams(**{field.name: getattr(args, field.name) for field in fields(PipelineParams)})
+    movies = find_movies(args.input_dir, args.pattern)
+    if not movies:
+        parser.error(f"no '{args.pattern}' files in {args.input_dir}")
+
+    def report(result):
+        if 'error' in result:
+            print(f"{result['movie']}: failed\n{result['error']}", file=sys.stderr)
+        else:
+            done = [f"{stage} skipped" if s['skipped'] else f"{stage} {s['seconds']:.1f}s" for stage, s in result['stages'].items()]
+            print(f"{result['movie']}: {', '.join(done)}")
+
+    start = time.perf_counter()
+    results = run_batch(movies, args.output_dir, params, stages, args.workers, args.overwrite, callback=report)
+    summary = summarize(results)
+    print(summary.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+    print(f"{len(movies)} movies in {time.perf_counter() - start:.1f}s")
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    args.output_dir.joinpath(_SUMMARY_FILE_NAME_).write_text(json.dumps({
+        'params': asdict(params),
+        'stages': summary.replace({np.nan: None}).to_dict(orient='records'),
+        'movies': results,
+    }, indent=2))
+    return 1 if any('error' in result for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,14 +3,13 @@ import sys
 from pathlib import Path
 from typing import Optional
 import numpy as np
-import tifffile
 import matplotlib
-from typing import Optional
 from matplotlib.backends.backend_qtagg import (
     FigureCanvas,
     NavigationToolbar2QT,
 )
 from matplotlib.figure import Figure
+from matplotlib.patches import Rectangle
 from qtpy.QtGui import QIcon
 from qtpy.QtWidgets import QLabel, QVBoxLayout, QWidget
 
@@ -58,7 +57,14 @@ class BaseMPLWidget(QWidget):
 
 
 class HistogramWidget(BaseMPLWidget):
-    
+    """
+    Histogram of a property.
+
+    ``set_data`` computes the bin edges and counts of the full data once,
+    ``update_counts`` only re-bins the filtered data into the same edges and
+    updates the bar heights, ``set_range`` moves a blitted overlay showing the
+    current filter range.
+    """
     def __init__(
         self,
         parent: Optional[QWidget] = None,
@@ -71,6 +77,13 @@ class HistogramWidget(BaseMPLWidget):
         self.label = None
         self.color = None
 
+        self.edges = None
+        self.full_stairs = None
+        self.stairs = None
+        self.range_patch = None
+        self.background = None
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
     def clear(self) -> None:
         """
         Clear any previously drawn figures.
@@ -78,6 +91,16 @@ class HistogramWidget(BaseMPLWidget):
         This is a no-op, and is intended for derived classes to override.
         """
         self.axes.clear()
+        self.edges = None
+        self.full_stairs = None
+        self.stairs = None
+        self.range_patch = None
+        self.background = None
+
+    @staticmethod
+    def _finite(data) -> np.ndarray:
+        y = np.asarray(data, dtype=float).ravel()
+        return y[np.isfinite(y)]
 
     def draw(self, data, label, bins=256, color=colors['COLOR_1']) -> None:
         self.clear()
@@ -92,5 +115,51 @@ class HistogramWidget(BaseMPLWidget):
             self.axes.legend(loc='upper right')
 
         # needed
-        self.canvas.draw()
+        self.canvas.draw_idle()
+
+    def set_data(self, data, label, bins=256, color=colors['COLOR_1']) -> None:
+        """Bin the full data once and draw it as the reference histogram."""
+        self.clear()
+        self.data = data
+        self.label = label
+        self.color = color
+        y = self._finite(data)
+        if len(y):
+            counts, self.edges = np.histogram(y, bins=bins)
+            self.full_stairs = self.axes.stairs(counts, self.edges, color=colors['COLOR_2'], alpha=0.3, fill=True, label="all")
+            self.stairs = self.axes.stairs(counts, self.edges, color=color, fill=True, label=label)
+            self.range_patch = Rectangle((self.edges[0], 0), self.edges[-1] - self.edges[0], 1,
+                                         transform=self.axes.get_xaxis_transform(),
+                                         color=colors['COLOR_5'], alpha=0.2, animated=True)
+            self.axes.add_patch(self.range_patch)
+            self.axes.legend(loc='upper right')
+        self.canvas.draw_idle()
+
+    def update_counts(self, data) -> None:
+        """Re-bin the filtered data into the cached edges and update the bar heights."""
+        if self.stairs is None:
+            self.draw(data, self.label, color=self.color or colors['COLOR_1'])
+            return
+        counts, _ = np.histogram(self._finite(data), bins=self.edges)
+        self.stairs.set_data(counts)
+        self.canvas.draw_idle()
+
+    def _on_draw(self, event) -> None:
+        if self.range_patch is None:
+            return
+        self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+        self.axes.draw_artist(self.range_patch)
+
+    def set_range(self, vmin, vmax) -> None:
+        """Move the filter range overlay, blitted over the cached background."""
+        if self.range_patch is None:
+            return
+        self.range_patch.set_x(vmin)
+        self.range_patch.set_width(vmax - vmin)
+        if self.background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.axes.draw_artist(self.range_patch)
+        self.canvas.blit(self.axes.bbox)
 ########################################
\ No newline at end of file
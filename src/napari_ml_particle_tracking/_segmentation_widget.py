@@ -1,36 +1,113 @@
 import os
 import sys
+import time
 from pathlib import Path
 
 import numpy as np
 import napari
 from napari.utils import progress
+from napari.utils.notifications import show_error, show_info
+from napari.qt.threading import thread_worker
 
-from qtpy.QtWidgets import QPushButton, QHBoxLayout, QSpinBox, QCheckBox, QFileDialog, QMessageBox
-from qtpy.QtCore import Qt
+from qtpy.QtWidgets import QPushButton, QHBoxLayout, QSpinBox, QDoubleSpinBox, QCheckBox, QComboBox, QFileDialog, QMessageBox
+from qtpy.QtCore import Qt, QTimer
 from ._base_widget import NapariLayersWidget
+from ._inference import _MIN_TILE_SIZE_, infer_frames, frames_per_batch, mask_iou
+from ._backends import BACKENDS, clear_predictor_cache
+from ._pipeline import inference_predictor, iter_segment
+from ._io import create_mask_store, is_mask_store, iter_write_mask, MASK_FILE_FILTER
+from ._model import get_model, _MODEL_FILE_PATH_
+from ._training_store import TrainingSampleStore, source_id
+from ._config import get_config, set_config, save_config, apply_torch_threads, configure_data_loader
 from pathlib import Path
-import tifffile
 
-from particle_tracking import Model, Data2D, Dataset2D
-from torch import nn, optim
 
-_MODEL_FILE_NAME_ = 'model_final.pt'
-_MODEL_DIR_ = Path.home().joinpath('.ml_particle_tracking')
-_MODEL_FILE_PATH_ = _MODEL_DIR_.joinpath(_MODEL_FILE_NAME_)
+@thread_worker
+def segment_worker(image_data, pred, batch_size=8, tile_size=0, backend='float32', min_iou=0.95):
+    """Writes masks into ``pred`` in place, yields ``(first_frame, n_frames)`` per batch."""
+    yield from iter_segment(image_data, pred, batch_size=batch_size, tile_size=tile_size, backend=backend, min_iou=min_iou)
+
+
+@thread_worker
+def resegment_worker(image_data, pred, indices, batch_size=8, tile_size=0, backend='float32', min_iou=0.95):
+    """
+    Re-infers only ``indices`` into ``pred`` in place, yields
+    ``(frame_indices, iou)`` of the new masks against the previous ones.
+    """
+    model = inference_predictor(image_data, tile_size, backend, min_iou)
+    for batch_indices, masks in infer_frames(model, image_data, indices, batch_size=batch_size, tile_size=tile_size):
+        iou = mask_iou(np.stack([np.asarray(pred[i]) for i in batch_indices]), masks)
+        for i, mask in zip(batch_indices, masks):
+            pred[i] = mask
+        yield batch_indices, iou
+
+
+@thread_worker
+def train_worker(training_image, training_mask, n_epochs):
+    """Yields the epoch index after every finished epoch."""
+    from particle_tracking import Data2D, Dataset2D
+
+    model = get_model()
+    apply_torch_threads(training=True)
+    _data = Data2D(training_image, training_mask)
+    _dataset = Dataset2D(_data.images, _data.labels)
+    _dataloader = configure_data_loader(_dataset.get_single_data_loader())
+    for epoch in range(n_epochs):
+        model.train(True)
+        model.train_one_epoch(_dataloader, epoch_index=epoch)
+        yield epoch
+
+
+@thread_worker
+def save_worker(path, mask_data):
+    """Yields the number of frames written after every chunk."""
+    yield from iter_write_mask(path, mask_data)
 
 
-    
 class SegmentationWidget(NapariLayersWidget):
     def __init__(self, napari_viewer : napari.viewer.Viewer):
         super().__init__(napari_viewer)
         
         
         self.sb_epochs = QSpinBox()
+        self.sb_batch_size = QSpinBox()
+        self.sb_tile_size = QSpinBox()
         self.cb_use_entire_mask = QCheckBox()
         self.cb_use_entire_mask.setCheckState(Qt.CheckState.Checked)
+        self.cb_incremental = QCheckBox()
+        self.cb_incremental.setToolTip("Fine-tune on the edited frames plus a replay sample of stored training frames")
+        self.sb_replay_size = QSpinBox()
+        self.sb_replay_size.setRange(0, 10000)
+        self.sb_replay_size.setValue(32)
+        self.sb_validation_frames = QSpinBox()
+        self.sb_validation_frames.setRange(0, 1000)
+        self.sb_validation_frames.setValue(16)
+        self.cb_resegment_full = QCheckBox()
+        self.cb_resegment_full.setToolTip("After the edited/validation frames, re-segment the whole stack in the background")
+        self.cb_backend = QComboBox()
+        self.cb_backend.addItems(BACKENDS)
+        self.cb_backend.setToolTip("CPU inference backend, checked against float32 before use")
+        self.sb_min_iou = QDoubleSpinBox()
+        self.sb_min_iou.setRange(0.0, 1.0)
+        self.sb_min_iou.setSingleStep(0.01)
+        self.sb_min_iou.setValue(0.95)
+        config = get_config()
+        self.sb_torch_threads = QSpinBox()
+        self.sb_torch_threads.setRange(0, 1024)
+        self.sb_torch_threads.setValue(config.torch_threads)
+        self.sb_dataloader_workers = QSpinBox()
+        self.sb_dataloader_workers.setRange(0, 256)
+        self.sb_dataloader_workers.setValue(config.dataloader_workers)
+        self.sb_dataloader_prefetch = QSpinBox()
+        self.sb_dataloader_prefetch.setRange(1, 64)
+        self.sb_dataloader_prefetch.setValue(config.dataloader_prefetch)
+        self.cb_stream_to_disk = QCheckBox()
+        self.cb_stream_to_disk.setToolTip("Write the mask into a chunked zarr store instead of memory")
         self.btn_segment = QPushButton("Generate Mask")
         self.btn_train = QPushButton("Re-Train")
+        self.btn_cancel = QPushButton("Cancel")
+        self.worker = None
+        self.worker_progress = None
 
         # { TODO: update late 
         # self.btn_train.setVisible(False)
@@ -39,10 +116,23 @@ class SegmentationWidget(NapariLayersWidget):
 
         self.layer_layout.addRow("Number of Epochs", self.sb_epochs)
         self.layer_layout.addRow("Use entire mask to retrain", self.cb_use_entire_mask)
+        self.layer_layout.addRow("Incremental retraining", self.cb_incremental)
+        self.layer_layout.addRow("Replay samples", self.sb_replay_size)
+        self.layer_layout.addRow("Validation frames after training", self.sb_validation_frames)
+        self.layer_layout.addRow("Re-segment full stack after training", self.cb_resegment_full)
+        self.layer_layout.addRow("Inference batch size", self.sb_batch_size)
+        self.layer_layout.addRow("Tile size", self.sb_tile_size)
+        self.layer_layout.addRow("Inference backend", self.cb_backend)
+        self.layer_layout.addRow("Minimum IoU vs float32", self.sb_min_iou)
+        self.layer_layout.addRow("Stream mask to disk (zarr)", self.cb_stream_to_disk)
+        self.layer_layout.addRow("Torch threads (0 = auto)", self.sb_torch_threads)
+        self.layer_layout.addRow("DataLoader workers", self.sb_dataloader_workers)
+        self.layer_layout.addRow("DataLoader prefetch", self.sb_dataloader_prefetch)
         
         btn_layout = QHBoxLayout()
         btn_layout.addWidget(self.btn_segment)
         btn_layout.addWidget(self.btn_train)
+        btn_layout.addWidget(self.btn_cancel)
         
         
         self.layout().addLayout(btn_layout)
@@ -55,6 +145,14 @@ class SegmentationWidget(NapariLayersWidget):
         self.sb_epochs.setDisabled(True)
         self.btn_train.setDisabled(True)
 
+        self.sb_batch_size.setRange(1, 256)
+        self.sb_batch_size.setValue(8)
+        self.sb_tile_size.setRange(0, 4096)
+        self.sb_tile_size.setSingleStep(_MIN_TILE_SIZE_)
+        self.sb_tile_size.setSpecialValueText("Full frame")
+        self.sb_tile_size.setValue(0)
+        self.sb_tile_size.editingFinished.connect(self.snap_tile_size)
+
         # init btns
         self.open_action.setVisible(False)
         self.save_action.setVisible(True)
@@ -62,23 +160,48 @@ class SegmentationWidget(NapariLayersWidget):
         self.saveClicked.connect(self.save)
         self.btn_segment.clicked.connect(self.segment)
         self.btn_train.clicked.connect(self.train)
+        self.btn_cancel.clicked.connect(self.cancel)
+        # pool sizes are shared through ~/.ml_particle_tracking/config.json,
+        # changes apply right away and are saved once the spin boxes are idle
+        self.config_timer = QTimer(self)
+        self.config_timer.setSingleShot(True)
+        self.config_timer.setInterval(500)
+        self.config_timer.timeout.connect(lambda: save_config(get_config()))
+        self.sb_torch_threads.valueChanged.connect(lambda v: self.config_changed(torch_threads=v))
+        self.sb_dataloader_workers.valueChanged.connect(lambda v: self.config_changed(dataloader_workers=v))
+        self.sb_dataloader_prefetch.valueChanged.connect(lambda v: self.config_changed(dataloader_prefetch=v))
+        self.btn_cancel.setDisabled(True)
 
         self.update_btns()
         self.comboBoxUpdated.connect(self.update_btns)
         self.comboBoxUpdated.connect(self.attach_mask_layer)
-        
-        # inti ml
-        self.init_ml()
+
 
         self.mask_layer = None
         self.image_layer = None
         self.training_image = None
         self.training_mask = None
         self.change_indices = set()
+        self.trained_indices = []
+        self.training_store = TrainingSampleStore()
 
     
+    def config_changed(self, **values):
+        set_config(**values)
+        self.config_timer.start()
+
+    def snap_tile_size(self):
+        # typed in tile sizes below the minimum would be mostly overlap
+        if 0 < self.sb_tile_size.value() < _MIN_TILE_SIZE_:
+            self.sb_tile_size.setValue(_MIN_TILE_SIZE_)
+
     def update_btns(self):
-        
+        if self.worker is not None:
+            # a segmentation/training run is in progress
+            self.btn_segment.setDisabled(True)
+            self.btn_train.setDisabled(True)
+            return
+
         if self.combo_image_layers.count():
             self.btn_segment.setDisabled(False)
         else:
@@ -100,48 +223,123 @@ class SegmentationWidget(NapariLayersWidget):
         #     del self.mask_layer
         #     self.mask_layer = None
     
-    def init_ml(self):
-        n_epochs = self.sb_epochs.value()
-        learning_rate = 1.e-4
-        train_test_split = 0.7
-        loss_function  = nn.BCEWithLogitsLoss()
-
-        # data = Data2D(image_layer, mask)
-
-        # dataset = Dataset2D(data.images, data.labels)
-        # train_dataloader, test_dataloader, acc_dataloader = dataset.get_data_loader(split=train_test_split)
-        self.model = Model(
-                    pre_trained_model_path=_MODEL_FILE_PATH_,
-                    optimizerCls=optim.Adam,
-                    learning_rate = learning_rate,
-                    loss_fn=loss_function,
-                    encoder_name="resnet18", 
-                    encoder_weights="imagenet",
-                    in_channels = 1, 
-                    classes=1,
-                    is_inference_mode=True
-                )
+    @property
+    def model(self):
+        # built on first use and shared with every other widget
+        return get_model()
+
+    def run_worker(self, worker, total, desc, on_yielded):
+        self.worker = worker
+        self.worker_progress = progress(total=total, desc=desc)
+        worker.yielded.connect(on_yielded)
+        # a failed backend export/validation or save must not leave the buttons disabled
+        worker.errored.connect(lambda e: self.worker_errored(desc, e))
+        worker.finished.connect(self.worker_finished)
+        self.btn_cancel.setDisabled(False)
+        self.update_btns()
+        worker.start()
+
+    def worker_finished(self):
+        if self.worker_progress is not None:
+            self.worker_progress.close()
+        self.worker_progress = None
+        self.worker = None
+        self.btn_cancel.setDisabled(True)
+        self.update_btns()
+
+    def worker_errored(self, desc, error):
+        self.worker_finished()
+        show_error(f"{desc} failed: {error}")
+
+    def cancel(self):
+        # generator workers stop at the next yield, i.e. after the current batch/epoch
+        if self.worker is not None:
+            self.worker.quit()
 
     def segment(self):
         image_layer_index = self.combo_image_layers.currentData()
         self.image_layer = self.viewer.layers[image_layer_index]
         image_data = self.image_layer.data
 
-        pred = np.zeros_like(image_data, dtype=np.uint8)
-        for i in progress(range(image_data.shape[0]), desc="Inference Loop"):
-            mask = self.model.inference(image_data[i])
-            pred[i] = mask.astype(np.uint8)
-
+        pred = self.reusable_mask_buffer(image_data)
+        if pred is None:
+            pred = self.create_mask_buffer(image_data)
+        if pred is None:
+            return
+        # masks are streamed into the layer while the worker runs
         if self.combo_mask_layers.count():
             mask_layer_index = self.combo_mask_layers.currentData()
             self.mask_layer = self.viewer.layers[mask_layer_index]
-            self.mask_layer.data = pred
+            if self.mask_layer.data is not pred:
+                self.mask_layer.data = pred
         else:
-            self.viewer.add_labels(pred, name="Mask")
+            self.mask_layer = self.viewer.add_labels(pred, name="Mask")
+
+        worker = segment_worker(image_data, pred,
+                                batch_size=self.sb_batch_size.value(),
+                                tile_size=self.sb_tile_size.value(),
+                                backend=self.cb_backend.currentText(),
+                                min_iou=self.sb_min_iou.value())
+        self.run_worker(worker, image_data.shape[0], "Inference Loop", self.segment_yielded)
+
+    def reusable_mask_buffer(self, image_data):
+        # overwrite the current in-memory mask instead of allocating a new one
+        if self.cb_stream_to_disk.isChecked():
+            return None
+        mask_data = self.current_mask_data(image_data)
+        return mask_data if isinstance(mask_data, np.ndarray) else None
+
+    def current_mask_data(self, image_data):
+        """The current mask if it can be written in place, in memory or a streamed zarr store."""
+        if not self.combo_mask_layers.count():
+            return None
+        mask_data = self.viewer.layers[self.combo_mask_layers.currentData()].data
+        if mask_data.shape != image_data.shape:
+            return None
+        if isinstance(mask_data, np.ndarray) and mask_data.flags.writeable:
+            return mask_data
+        if is_mask_store(mask_data):
+            return mask_data
+        return None
+
+    def create_mask_buffer(self, image_data):
+        # image_data may be lazy (dask/zarr/memmap), never use zeros_like on it
+        if self.cb_stream_to_disk.checkState() == Qt.CheckState.Unchecked:
+            return np.zeros(image_data.shape, dtype=np.uint8)
+
+        file_path = QFileDialog.getSaveFileName(self, caption="Mask Store", directory=str(Path.home()), filter="*.zarr")
+        if not file_path[0]:
+            return None
+        chunk_frames = frames_per_batch(image_data.shape[-2:], self.sb_batch_size.value(), self.sb_tile_size.value())
+        try:
+            return create_mask_store(file_path[0], image_data.shape, chunk_frames=chunk_frames)
+        except ImportError as e:
+            QMessageBox.warning(self, "Segmentation error", str(e))
+            return None
+
+    def segment_yielded(self, value):
+        _, n_frames = value
+        self.worker_progress.update(n_frames)
+        self.mask_layer.refresh()
+
+    def store_edited_frames(self):
+        # edited frames are kept on disk so corrections accumulate across sessions
+        if not self.change_indices:
+            return []
+        source = source_id(self.image_layer.name, self.image_layer.data.shape)
+        return self.training_store.add_frames(self.image_layer.data, self.mask_layer.data, self.change_indices, source)
 
     def train(self):
+        new_keys = self.store_edited_frames()
+        self.trained_indices = sorted(self.change_indices)
         # prepare data
-        if self.cb_use_entire_mask.checkState() == Qt.CheckState.Unchecked:
+        if self.cb_incremental.isChecked():
+            keys = self.training_store.sample(self.sb_replay_size.value(), include=new_keys)
+            self.training_image, self.training_mask = self.training_store.load_stack(keys)
+            if not len(self.training_image):
+                QMessageBox.warning(self, "Training error", "No stored training frames.\nEdit some frames in paint mode first.")
+                return
+        elif self.cb_use_entire_mask.checkState() == Qt.CheckState.Unchecked:
             indices = list(self.change_indices)
             self.training_image = self.image_layer.data[indices]
             self.training_mask = self.mask_layer.data[indices]
@@ -150,17 +348,72 @@ class SegmentationWidget(NapariLayersWidget):
             self.training_mask = self.mask_layer.data
 
         self.change_indices = set()
-        _data = Data2D(self.training_image, self.training_mask)
-        _dataset = Dataset2D(_data.images, _data.labels)
-        _dataloader = _dataset.get_single_data_loader()
         n_epochs = self.sb_epochs.value()
-        for epoch in progress(range(n_epochs), desc="Training"):
-            self.model.train(True)
-            self.model.train_one_epoch(_dataloader, epoch_index=epoch)
-        
+        worker = train_worker(self.training_image, self.training_mask, n_epochs)
+        # returned is not emitted when the run is cancelled
+        worker.returned.connect(self.training_done)
+        self.run_worker(worker, n_epochs, "Training", self.train_yielded)
+
+    def train_yielded(self, epoch):
+        self.worker_progress.update(1)
+
+    def training_done(self, _=None):
         self.model.save(_MODEL_FILE_PATH_)
+        # quantized/exported models were built from the old weights
+        clear_predictor_cache()
         print("training done- segmenting")
-        self.segment()
+        # wait for the training worker to be cleaned up before starting inference
+        QTimer.singleShot(0, self.resegment_changed)
+
+    def resegment_changed(self):
+        """Re-infer the edited frames plus a random validation sample into the current mask."""
+        image_data = self.image_layer.data
+        # streamed stores are updated in place as well, frame by frame
+        pred = self.current_mask_data(image_data)
+        if pred is None:
+            # no compatible mask to update in place
+            self.segment()
+            return
+
+        n_frames = image_data.shape[0]
+        edited = {i for i in self.trained_indices if i < n_frames}
+        others = np.setdiff1d(np.arange(n_frames), list(edited))
+        n_validation = min(self.sb_validation_frames.value(), len(others))
+        validation = set(np.random.default_rng().choice(others, size=n_validation, replace=False).tolist())
+        indices = sorted(edited | validation)
+        if not indices:
+            self.resegment_finished()
+            return
+
+        self.resegment_iou = {}
+        self.resegment_edited = edited
+        worker = resegment_worker(image_data, pred, indices,
+                                  batch_size=self.sb_batch_size.value(),
+                                  tile_size=self.sb_tile_size.value(),
+                                  backend=self.cb_backend.currentText(),
+                                  min_iou=self.sb_min_iou.value())
+        worker.returned.connect(self.resegment_finished)
+        self.run_worker(worker, len(indices), "Re-segmenting changed frames", self.resegment_yielded)
+
+    def resegment_yielded(self, value):
+        batch_indices, iou = value
+        self.resegment_iou.update(zip(batch_indices.tolist(), iou.tolist()))
+        self.worker_progress.update(len(batch_indices))
+        self.mask_layer.refresh()
+
+    def resegment_finished(self, _=None):
+        iou = getattr(self, 'resegment_iou', {})
+        if iou:
+            edited = [v for k, v in iou.items() if k in self.resegment_edited]
+            validation = [v for k, v in iou.items() if k not in self.resegment_edited]
+            parts = []
+            if edited:
+                parts.append(f"edited frames mean IoU {np.mean(edited):.3f}")
+            if validation:
+                parts.append(f"validation frames mean IoU {np.mean(validation):.3f}")
+            show_info(f"Re-segmented {len(iou)} frames, " + ", ".join(parts) + " against the previous masks")
+        if self.cb_resegment_full.isChecked():
+            QTimer.singleShot(0, self.segment)
         
     
     def training_data_collection(self, layer, event):
@@ -181,10 +434,29 @@ class SegmentationWidget(NapariLayersWidget):
             self.image_layer = self.viewer.layers[mask_image_index]
 
     def save(self):
-        file_path = QFileDialog.getSaveFileName(self, caption="Save Mask", directory=str(Path.home()), filter="*.tif")
+        if self.worker is not None:
+            return
         if self.combo_mask_layers.count():
+            file_path = QFileDialog.getSaveFileName(self, caption="Save Mask", directory=str(Path.home()), filter=MASK_FILE_FILTER)
+            if not file_path[0]:
+                return
+            path = Path(file_path[0])
+            if not path.suffix:
+                path = path.with_suffix('.tif')
             mask_layer_index = self.combo_mask_layers.currentData()
             self.mask_layer = self.viewer.layers[mask_layer_index]
-            tifffile.imwrite(file_path[0], self.mask_layer.data.astype(np.uint8))
+            mask_data = self.mask_layer.data
+            self.save_started = time.perf_counter()
+            self.saved_frames = 0
+            self.frame_bytes = int(np.prod(mask_data.shape[1:]))
+            worker = save_worker(path, mask_data)
+            self.run_worker(worker, mask_data.shape[0], "Saving mask", self.save_yielded)
         else:
             QMessageBox.warning(self, "Save error", "No mask layer available to save.\nMake sure you have 'Mask' Layer by clicking on 'Generate Mask'. ")
+
+    def save_yielded(self, n_frames):
+        self.saved_frames += n_frames
+        self.worker_progress.update(n_frames)
+        elapsed = max(time.perf_counter() - self.save_started, 1e-6)
+        mb_per_s = self.saved_frames * self.frame_bytes / elapsed / 1e6
+        self.worker_progress.set_description(f"Saving mask {mb_per_s:.1f} MB/s")
@@ -0,0 +1,110 @@
+"""
+Persistent cache of step tables.
+
+Tables are stored in ``~/.ml_particle_tracking/step_cache.sqlite`` keyed by
+a hash of the intensity trace and the step finder parameters, so a trace
+is only fitted again when it or the parameters changed. The least recently
+used entries are dropped once the stored tables exceed ``max_bytes``.
+"""
+import contextlib
+import hashlib
+import io
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Mapping
+
+import numpy as np
+
+from ._model import _MODEL_DIR_
+
+_CACHE_FILE_PATH_ = _MODEL_DIR_.joinpath('step_cache.sqlite')
+_CACHE_MAX_BYTES_ = 256 * 1024 ** 2
+# bump when the step finders change their results, old entries stop matching
+_CACHE_VERSION_ = 1
+
+
+def trace_key(intensity, params: Mapping) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(intensity, dtype=np.float64).tobytes())
+    digest.update(json.dumps(dict(params, version=_CACHE_VERSION_), sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _to_bytes(steptable) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, np.asarray(steptable), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _from_bytes(value: bytes) -> np.ndarray:
+    return np.load(io.BytesIO(value), allow_pickle=False)
+
+
+class StepCache:
+    def __init__(self, path: Path = _CACHE_FILE_PATH_, max_bytes: int = _CACHE_MAX_BYTES_) -> None:
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS steps (key TEXT PRIMARY KEY, value BLOB, size INTEGER, last_used REAL)")
+            db.execute("CREATE INDEX IF NOT EXISTS steps_last_used ON steps (last_used)")
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # a connection per call, the cache may be used from worker threads
+        db = sqlite3.connect(str(self.path), timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def __len__(self) -> int:
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM steps").fetchone()[0]
+
+    def total_bytes(self) -> int:
+        with self._connect() as db:
+            return db.execute("SELECT COALESCE(SUM(size), 0) FROM steps").fetchone()[0]
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Cached step tables of ``keys``, missing keys are left out. Hits count as a use."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        with self._connect() as db:
+            # stay below SQLite's bound parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                marks = ','.join('?' * len(chunk))
+                rows = db.execute(f"SELECT key, value FROM steps WHERE key IN ({marks})", chunk).fetchall()
+                found.update((key, _from_bytes(value)) for key, value in rows)
+                db.execute(f"UPDATE steps SET last_used = ? WHERE key IN ({marks})", [now, *chunk])
+        return found
+
+    def put_many(self, items: Mapping[str, object]) -> None:
+        now = time.time()
+        rows = [(key, value, len(value), now) for key, value in ((key, _to_bytes(table)) for key, table in items.items())]
+        with self._connect() as db:
+            db.executemany("INSERT OR REPLACE INTO steps (key, value, size, last_used) VALUES (?, ?, ?, ?)", rows)
+        self.evict()
+
+    def evict(self) -> None:
+        """Drop the least recently used tables until the cache fits ``max_bytes``."""
+        with self._connect() as db:
+            excess = db.execute("SELECT COALESCE(SUM(size), 0) FROM steps").fetchone()[0] - self.max_bytes
+            if excess <= 0:
+                return
+            stale = []
+            for key, size in db.execute("SELECT key, size FROM steps ORDER BY last_used"):
+                stale.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            db.executemany("DELETE FROM steps WHERE key = ?", stale)
+
+    def clear(self) -> None:
+        with self._connect() as db:
+            db.execute("DELETE FROM steps")
@@ -0,0 +1,129 @@
+"""
+Step detection on track intensity traces.
+
+``analyse_tracks`` fans the traces out over a process pool in chunks and
+collects the step tables once at the end.
+"""
+import functools
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ._config import get_config, single_threaded_children
+from ._step_cache import StepCache, trace_key
+
+# below this many traces the pool start-up costs more than it saves
+_MIN_TRACKS_PER_WORKER_ = 16
+
+
+def steps_table(intensity, fit):
+    from particle_tracking.utils import Fit2StepsTable
+
+    dataX = np.asarray(intensity, dtype=float)
+    if not len(dataX):
+        return np.zeros((0, 0))
+    return Fit2StepsTable(dataX, fit)
+
+
+def detect_steps(intensity, tres_h: float = 0.1, n_passes: int = 3):
+    # Auto step finder
+    import particle_tracking.stepfindCore as core
+    import particle_tracking.stepfindTools as st
+
+    dataX = np.asarray(intensity, dtype=float)
+    if not len(dataX):
+        return dataX, np.zeros((0, 0))
+    FitX = 0 * dataX
+
+    # multipass:
+    for _ in range(0, n_passes, 1):
+        # work remaining part of data:
+        residuX = dataX - FitX
+        newFitX, _, _, _, _ = core.stepfindcore(
+            residuX, tres_h
+        )
+        FitX = st.AppendFitX(newFitX, FitX, dataX)
+
+    # steps from final fit:
+    return FitX, steps_table(dataX, FitX)
+
+
+def _detect_steps_chunk(chunk: List[Tuple[object, np.ndarray]], tres_h: float = 0.1, n_passes: int = 3,
+                        detect: Optional[Callable] = None) -> List[Tuple[object, object]]:
+    detect = detect or detect_steps
+    return [(track_id, detect(intensity, tres_h, n_passes)[1]) for track_id, intensity in chunk]
+
+
+def _chunks(items: Sequence, size: int) -> Iterable[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def analyse_tracks(traces: Sequence[Tuple[object, np.ndarray]], n_workers: Optional[int] = None,
+                   chunk_size: Optional[int] = None, callback: Optional[Callable[[int], None]] = None,
+                   tres_h: float = 0.1, n_passes: int = 3, cache: Optional[StepCache] = None,
+                   detect: Optional[Callable] = None) -> Tuple[pd.DataFrame, pd.Series]:
+    """
+    Detect steps for ``(track_id, intensity)`` pairs.
+
+    Returns the concatenated steps table (with a ``particle`` column) and the
+    step count per track id. ``callback`` is called with the number of traces
+    finished after every chunk. Traces found in ``cache`` are not fitted
+    again, new results are added to it. ``detect(intensity, tres_h, n_passes)``
+    returns ``(fit, steptable)`` of one trace, ``detect_steps`` by default. It
+    is sent to the worker processes and has to be a module level function.
+    """
+    detect_chunk = functools.partial(_detect_steps_chunk, tres_h=tres_h, n_passes=n_passes, detect=detect)
+    traces = list(traces)
+    all_traces = traces
+    cached = {}
+    if cache is not None:
+        params = {'tres_h': tres_h, 'n_passes': n_passes}
+        if detect is not None:
+            params['detect'] = f"{detect.__module__}.{detect.__qualname__}"
+        keys = [trace_key(intensity, params) for _, intensity in traces]
+        cached = cache.get_many(keys)
+        traces = [trace for trace, key in zip(traces, keys) if key not in cached]
+        if callback is not None and len(all_traces) > len(traces):
+            callback(len(all_traces) - len(traces))
+    n_workers = n_workers or get_config().resolved_step_workers()
+    n_workers = max(1, min(n_workers, len(traces) // _MIN_TRACKS_PER_WORKER_))
+    if chunk_size is None:
+        # a few chunks per worker keeps the load balanced
+        chunk_size = max(1, math.ceil(len(traces) / (n_workers * 4)))
+
+    results = []
+    if n_workers == 1:
+        for chunk in _chunks(traces, chunk_size):
+            results.extend(detect_chunk(chunk))
+            if callback is not None:
+                callback(len(chunk))
+    else:
+        # spawn, forking a process that runs Qt is not safe
+        context = multiprocessing.get_context('spawn')
+        # one process per core, each with single threaded NumPy
+        with single_threaded_children(), ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as executor:
+            for chunk_result in executor.map(detect_chunk, _chunks(traces, chunk_size)):
+                results.extend(chunk_result)
+                if callback is not None:
+                    callback(len(chunk_result))
+
+    if cache is not None:
+        # back in the input order, cached tables included
+        fitted = iter(results)
+        results = [(track_id, cached[key]) if key in cached else next(fitted)
+                   for (track_id, _), key in zip(all_traces, keys)]
+        cache.put_many({key: steptable for key, (_, steptable) in zip(keys, results) if key not in cached})
+
+    steps = []
+    for track_id, steptable in results:
+        steps_df = pd.DataFrame(steptable)
+        steps_df['particle'] = track_id
+        steps.append(steps_df)
+    steps_info = pd.concat(steps, ignore_index=True) if steps else pd.DataFrame()
+    step_count = pd.Series({track_id: len(steptable) for track_id, steptable in results}, name='step_count', dtype=int)
+    return steps_info, step_count
@@ -2,68 +2,151 @@ import os
 import sys
 from pathlib import Path
 from typing import Optional
-from PyQt5 import QtCore
-from PyQt5.QtCore import QObject
-from PyQt5.QtWidgets import QWidget
 import numpy as np
-import tifffile
 import pandas as pd
 from pandas.core.groupby.generic import DataFrameGroupBy
 
 from qtpy.QtWidgets import QWidget, QTableView, QVBoxLayout
-from qtpy.QtCore import QAbstractTableModel, Qt, QModelIndex, QVariant
+from qtpy.QtCore import QAbstractTableModel, Qt, QModelIndex, QVariant, QObject
 
 class DataFrameModel(QAbstractTableModel):
+    """
+    Table model over a DataFrame that never touches pandas while painting.
+
+    Column values are cached as NumPy arrays, rows are exposed in batches
+    through ``canFetchMore``/``fetchMore`` and cell strings are formatted
+    only for rows that get painted. Sorting goes through a cached argsort
+    index instead of a sorted copy of the DataFrame.
+    """
+    fetch_batch = 1000
+    text_cache_rows = 5000
+
     def __init__(self, parent: QObject = None, dataframe: pd.DataFrame=pd.DataFrame() ) -> None:
         super().__init__(parent)
-        self.dataframe = dataframe
+        self.sort_column = None
+        self.sort_order = Qt.SortOrder.AscendingOrder
+        self._load(dataframe)
     
+    def _load(self, dataframe: pd.DataFrame):
+        self.dataframe = dataframe
+        if dataframe.shape[1] == 1:
+            # single column frames show their index as the first column
+            self.headers = [dataframe.index.name, dataframe.columns[0]]
+            self.arrays = [dataframe.index.to_numpy(), dataframe.iloc[:, 0].to_numpy()]
+        else:
+            self.headers = list(dataframe.columns)
+            self.arrays = [dataframe.iloc[:, i].to_numpy() for i in range(dataframe.shape[1])]
+        self.n_rows = dataframe.shape[0]
+        self.loaded_rows = min(self.fetch_batch, self.n_rows)
+        self.order = None
+        self.sort_index = {}
+        self.text_cache = {}
+        # keep the view sorted across setDataframe calls
+        if self.sort_column is not None:
+            self._apply_sort()
+
     def setDataframe(self, dataframe: pd.DataFrame):
         self.beginResetModel()
-        self.dataframe  = dataframe
+        self._load(dataframe)
         self.endResetModel()
 
     def rowCount(self, parent = QModelIndex())-> int:
-        return self.dataframe.shape[0]
+        if parent.isValid():
+            return 0
+        return self.loaded_rows
 
     def columnCount(self, parent = QModelIndex()) -> int:
-        if self.dataframe.shape[1] == 1:
-            return 2
-        return self.dataframe.shape[1]
+        if parent.isValid():
+            return 0
+        return len(self.arrays)
+
+    def canFetchMore(self, parent=None) -> bool:
+        if parent is not None and parent.isValid():
+            return False
+        return self.loaded_rows < self.n_rows
+
+    def fetchMore(self, parent=None):
+        if parent is not None and parent.isValid():
+            return
+        n_new = min(self.fetch_batch, self.n_rows - self.loaded_rows)
+        if n_new <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded_rows, self.loaded_rows + n_new - 1)
+        self.loaded_rows += n_new
+        self.endInsertRows()
+
+    def source_row(self, row: int) -> int:
+        """Row position in ``self.dataframe`` for a (possibly sorted) view row."""
+        if self.order is None:
+            return row
+        return int(self.order[row])
+
+    def row_text(self, row: int):
+        text = self.text_cache.get(row)
+        if text is None:
+            if len(self.text_cache) >= self.text_cache_rows:
+                self.text_cache.clear()
+            src = self.source_row(row)
+            text = [str(array[src]) for array in self.arrays]
+            self.text_cache[row] = text
+        return text
 
     def data(self, index, role = Qt.DisplayRole)-> QVariant:
         if (not index.isValid()) or (role != Qt.DisplayRole):
             return QVariant()
-        col_count = self.dataframe.shape[1]
-        if role == Qt.DisplayRole and col_count > 1:
-            return str(self.dataframe.iat[index.row(), index.column()])
-        elif role == Qt.DisplayRole and col_count == 1:
-            if index.column() == 0:
-                return str(self.dataframe.index[index.row()])
-            return str(self.dataframe.iat[index.row(), index.column()-1])
+        return self.row_text(index.row())[index.column()]
+
+    def _apply_sort(self):
+        column = self.sort_column
+        if not (0 <= column < len(self.arrays)):
+            self.order = None
+            return
+        if column not in self.sort_index:
+            self.sort_index[column] = np.argsort(self.arrays[column], kind='stable')
+        self.order = self.sort_index[column]
+        if self.sort_order == Qt.SortOrder.DescendingOrder:
+            self.order = self.order[::-1]
+        self.text_cache = {}
+
+    def sort(self, column: int, order = Qt.SortOrder.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+        self.sort_column = column
+        self.sort_order = order
+        self._apply_sort()
+        self.layoutChanged.emit()
 
     def headerData(self, section, orientation, role = Qt.DisplayRole) -> QVariant:
-        col_count = self.dataframe.shape[1]
-
         if role == Qt.DisplayRole:
-            if orientation == Qt.Orientation.Horizontal and col_count > 1:
-                return self.dataframe.columns[section]
-            elif orientation == Qt.Orientation.Horizontal and col_count == 1:
-                if section != 0:
-                    return self.dataframe.columns[section-1]
-                return self.dataframe.index.name
-            elif orientation == Qt.Orientation.Vertical and col_count > 1:
+            if orientation == Qt.Orientation.Horizontal and section < len(self.headers):
+                return self.headers[section]
+            elif orientation == Qt.Orientation.Vertical and self.dataframe.shape[1] > 1:
                 return str(section)
 
 class DataFrameGroupModel(QAbstractTableModel):
     def __init__(self, parent: QObject = None, dataframe: DataFrameGroupBy=DataFrameGroupBy(pd.DataFrame()), headers =  ['Group Name', 'Length']) -> None:
         super().__init__(parent)
-        self.dataframe = dataframe
         self.headers = headers
+        self.order = None
+        self._load(dataframe)
     
+    def _load(self, dataframe: DataFrameGroupBy):
+        self.dataframe = dataframe
+        # group keys and sizes computed once, data() is a plain array lookup
+        if hasattr(self.dataframe, 'groups'):
+            sizes = self.dataframe.size()
+            if isinstance(sizes, pd.DataFrame):
+                # as_index=False groupby returns a frame with a 'size' column
+                sizes = sizes.set_index(list(sizes.columns[:-1]))['size']
+            self.group_keys = sizes.index.to_numpy()
+            self.group_sizes = sizes.to_numpy()
+        else:
+            self.group_keys = np.zeros(0)
+            self.group_sizes = np.zeros(0, dtype=int)
+        self.order = None
+
     def setDataframe(self, dataframe: DataFrameGroupBy):
         self.beginResetModel()
-        self.dataframe  = dataframe
+        self._load(dataframe)
         self.endResetModel()
     
     def setHeader(self, headers):
@@ -72,9 +155,9 @@ class DataFrameGroupModel(QAbstractTableModel):
         self.endResetModel()
 
     def rowCount(self, parent = QModelIndex())-> int:
-        if hasattr(self.dataframe, 'groups'):
-            return len(self.dataframe.groups)
-        return 0
+        if parent.isValid():
+            return 0
+        return len(self.group_keys)
 
     def columnCount(self, parent = QModelIndex()) -> int:
         return 2
@@ -83,10 +166,18 @@ class DataFrameGroupModel(QAbstractTableModel):
         if (not index.isValid()) or (role != Qt.DisplayRole):
             return QVariant()
         if role == Qt.DisplayRole:
-            _group_key = list(self.dataframe.groups.keys())[index.row()]
-            _group_len = len(self.dataframe.get_group(_group_key))
-            _data = [_group_key, _group_len]
-            return str(_data[index.column()])
+            row = index.row() if self.order is None else self.order[index.row()]
+            if index.column() == 0:
+                return str(self.group_keys[row])
+            return str(self.group_sizes[row])
+
+    def sort(self, column: int, order = Qt.SortOrder.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+        values = self.group_keys if column == 0 else self.group_sizes
+        self.order = np.argsort(values, kind='stable')
+        if order == Qt.SortOrder.DescendingOrder:
+            self.order = self.order[::-1]
+        self.layoutChanged.emit()
 
     def headerData(self, section, orientation, role = Qt.DisplayRole) -> QVariant:
         if role == Qt.DisplayRole:
@@ -106,6 +197,7 @@ class PandasTable(QWidget):
 
         self.model = DataFrameGroupModel()
         self.table_view.setModel(self.model)
+        self.table_view.setSortingEnabled(True)
     
     def setDataframe(self, dataframe):
         self.model.setDataframe(dataframe)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from napari_ml_particle_tracking._backends import validate_predictor
+
+
+def tiles():
+    rng = np.random.default_rng(0)
+    return rng.random((4, 32, 32)).astype(np.float32)
+
+
+def reference(batch):
+    return batch
+
+
+def test_same_masks():
+    assert validate_predictor(reference, reference, tiles()) == 1.0
+
+
+def test_close_masks_pass():
+    # probabilities move, but only a few pixels cross the threshold
+    iou = validate_predictor(lambda batch: batch + 0.01, reference, tiles(), min_iou=0.9)
+    assert 0.9 <= iou < 1.0
+
+
+def test_drift_raises():
+    with pytest.raises(ValueError, match="IoU"):
+        validate_predictor(lambda batch: 1.0 - batch, reference, tiles(), min_iou=0.95)
+
+
+def test_threshold():
+    # everything is foreground for both at a zero threshold
+    assert validate_predictor(lambda batch: batch + 0.3, reference, tiles(), threshold=0.0) == 1.0
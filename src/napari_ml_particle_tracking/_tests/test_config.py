@@ -0,0 +1,65 @@
+import json
+import os
+
+from napari_ml_particle_tracking import _config
+from napari_ml_particle_tracking._config import (
+    _THREAD_ENV_VARS_,
+    ParallelConfig,
+    available_cores,
+    load_config,
+    save_config,
+    set_config,
+    single_threaded_children,
+    update_config,
+)
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "config.json"
+    config = ParallelConfig(torch_threads=3, step_workers=2, dataloader_prefetch=4)
+    save_config(config, path)
+    assert load_config(path) == config
+
+
+def test_missing_file_gives_defaults(tmp_path):
+    assert load_config(tmp_path / "missing.json") == ParallelConfig()
+
+
+def test_unknown_keys_are_ignored(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({'step_workers': '2', 'removed_option': 5}))
+    assert load_config(path) == ParallelConfig(step_workers=2)
+
+
+def test_resolved_sizes():
+    cores = available_cores()
+    config = ParallelConfig()
+    assert config.resolved_step_workers() == cores
+    assert config.resolved_feature_workers() == cores
+    assert config.resolved_torch_threads() == cores
+    config = ParallelConfig(step_workers=cores + 100, dataloader_workers=cores + 1)
+    assert config.resolved_step_workers() == cores
+    assert config.resolved_torch_threads(training=True) == 1
+    assert ParallelConfig(torch_threads=5).resolved_torch_threads() == 5
+
+
+def test_single_threaded_children(monkeypatch):
+    monkeypatch.setenv(_THREAD_ENV_VARS_[0], '8')
+    for name in _THREAD_ENV_VARS_[1:]:
+        monkeypatch.delenv(name, raising=False)
+    with single_threaded_children():
+        assert all(os.environ[name] == '1' for name in _THREAD_ENV_VARS_)
+    assert os.environ[_THREAD_ENV_VARS_[0]] == '8'
+    assert all(name not in os.environ for name in _THREAD_ENV_VARS_[1:])
+
+
+def test_set_config_does_not_save(monkeypatch):
+    saved = []
+    monkeypatch.setattr(_config, '_CONFIG_', ParallelConfig())
+    monkeypatch.setattr(_config, 'save_config', saved.append)
+    # spin boxes change the config on every tick, the widgets save it later
+    assert set_config(step_workers=3).step_workers == 3
+    assert saved == []
+    config = update_config(torch_threads='2')
+    assert saved == [config]
+    assert config == ParallelConfig(step_workers=3, torch_threads=2)
@@ -0,0 +1,50 @@
+import numpy as np
+
+from napari_ml_particle_tracking._features import (
+    extract_features,
+    frame_columns,
+)
+
+
+def stack():
+    mask = np.zeros((3, 20, 20), dtype=np.uint8)
+    image = np.ones((3, 20, 20))
+    mask[0, 2:4, 2:5] = 1
+    image[0, 2:4, 2:5] = 10.0
+    mask[0, 10:15, 12] = 1
+    mask[2, 5, 5] = 1
+    image[2, 5, 5] = 7.0
+    return mask, image
+
+
+def test_frame_columns():
+    mask, image = stack()
+    columns = frame_columns(mask[0], image[0], frame=4)
+    np.testing.assert_array_equal(columns['frame'], [4, 4])
+    np.testing.assert_array_equal(columns['label'], [1, 2])
+    np.testing.assert_array_equal(columns['area'], [6, 5])
+    np.testing.assert_allclose(columns['y'], [2.5, 12.0])
+    np.testing.assert_allclose(columns['x'], [3.0, 12.0])
+    np.testing.assert_allclose(columns['intensity_mean'], [10.0, 1.0])
+
+
+def test_empty_frame():
+    mask, image = stack()
+    columns = frame_columns(mask[1], image[1])
+    assert all(len(values) == 0 for values in columns.values())
+
+
+def test_extract_features_in_frame_order():
+    mask, image = stack()
+    calls = []
+    features = extract_features(mask, image, n_workers=2, callback=calls.append)
+    assert features['frame'].tolist() == [0, 0, 2]
+    assert features['intensity_mean'].tolist() == [10.0, 1.0, 7.0]
+    assert sum(calls) == len(mask)
+
+
+def test_extract_features_without_particles():
+    mask, image = stack()
+    features = extract_features(np.zeros_like(mask), image)
+    assert features.empty
+    assert {'frame', 'y', 'x', 'intensity_mean'} <= set(features.columns)
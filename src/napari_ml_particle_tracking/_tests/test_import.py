@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import napari_ml_particle_tracking
+
+# napari imports the package on every start to locate napari.yaml
+_BUDGET_MS_ = 50
+_HEAVY_MODULES_ = ('pandas', 'matplotlib', 'torch')
+
+_PROBE_ = """
+import sys
+import napari_ml_particle_tracking
+print(','.join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def import_package():
+    """Cumulative import time of the package in ms and the heavy modules loaded with it."""
+    env = dict(os.environ)
+    src = str(Path(napari_ml_particle_tracking.__file__).parent.parent)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [src, env.get('PYTHONPATH')]))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', _PROBE_.format(heavy=_HEAVY_MODULES_)],
+                            capture_output=True, text=True, check=True, env=env)
+    cumulative = None
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == 'napari_ml_particle_tracking':
+            cumulative = int(parts[1]) / 1000
+    assert cumulative is not None, result.stderr
+    return cumulative, [name for name in result.stdout.strip().split(',') if name]
+
+
+def test_import_is_light():
+    _, heavy = import_package()
+    assert heavy == []
+
+
+def test_import_time_budget():
+    # best of a few runs, the first one may compile bytecode
+    best = min(import_package()[0] for _ in range(3))
+    assert best < _BUDGET_MS_, f"importing the package took {best:.1f} ms"
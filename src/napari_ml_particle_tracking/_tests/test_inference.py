@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+
+from napari_ml_particle_tracking._backends import Predictor
+from napari_ml_particle_tracking._inference import (
+    _ENCODER_STRIDE_,
+    _MIN_TILE_SIZE_,
+    frame_batches,
+    frames_per_batch,
+    infer_batches,
+    infer_frame,
+    infer_frames,
+    mask_iou,
+    tile_slices,
+)
+
+
+def coverage(frame_shape, slices):
+    counts = np.zeros(frame_shape, dtype=int)
+    for ys, xs in slices:
+        counts[ys, xs] += 1
+    return counts
+
+
+def test_no_tiling():
+    assert tile_slices((100, 80), 0) == [(slice(0, 100), slice(0, 80))]
+    assert tile_slices((100, 80), 256) == [(slice(0, 100), slice(0, 80))]
+
+
+@pytest.mark.parametrize('tile_size', [128, 200, 256, 512])
+def test_tiles_cover_frame(tile_size):
+    slices = tile_slices((1000, 700), tile_size)
+    assert coverage((1000, 700), slices).min() >= 1
+    assert len({(ys.stop - ys.start, xs.stop - xs.start) for ys, xs in slices}) == 1
+
+
+@pytest.mark.parametrize('tile_size', [1, 16, 32, 64])
+def test_small_tiles_are_raised(tile_size):
+    slices = tile_slices((1024, 1024), tile_size)
+    assert slices == tile_slices((1024, 1024), _MIN_TILE_SIZE_)
+    assert len(slices) <= 11 * 11
+    assert coverage((1024, 1024), slices).min() >= 1
+
+
+def test_overlap_is_clamped():
+    # the overlap never exceeds a quarter of the tile
+    slices = tile_slices((1024, 1024), 256, overlap=1000)
+    starts = sorted({ys.start for ys, _ in slices})
+    assert min(np.diff(starts)) >= 256 - 256 // 4
+
+
+def test_frame_batches():
+    assert [list(r) for r in frame_batches(5, 2)] == [[0, 1], [2, 3], [4]]
+    assert frames_per_batch((256, 256), batch_size=8) == 8
+    assert frames_per_batch((1024, 1024), batch_size=8, tile_size=256) == 1
+
+
+def test_mask_iou():
+    a = np.zeros((2, 4, 4), dtype=np.uint8)
+    b = a.copy()
+    a[0, :2] = 1
+    b[0, :1] = 1
+    np.testing.assert_allclose(mask_iou(a, b), [0.5, 1.0])
+
+
+class PixelPredictor(Predictor):
+    """Pixelwise stand-in for the network, so tiling and batching must not change the masks."""
+    def __init__(self) -> None:
+        self.batch_shapes = []
+
+    def __call__(self, batch):
+        self.batch_shapes.append(batch.shape)
+        assert batch.dtype == np.float32
+        assert batch.min() >= 0.0 and batch.max() <= 1.0
+        return 1.0 / (1.0 + np.exp(-20.0 * (batch - 0.6)))
+
+
+@pytest.fixture
+def image():
+    rng = np.random.default_rng(0)
+    image = rng.poisson(100, size=(5, 300, 260)).astype(np.uint16)
+    image[:, 40:60, 100:120] += 60
+    # every frame in a different intensity range
+    return image * np.arange(1, 6, dtype=np.uint16)[:, np.newaxis, np.newaxis]
+
+
+@pytest.mark.parametrize('batch_size, tile_size', [(1, 0), (3, 0), (8, 0), (4, 128), (8, 200)])
+def test_batches_match_single_frames(image, batch_size, tile_size):
+    predictor = PixelPredictor()
+    expected = np.stack([infer_frame(predictor, frame) for frame in image])
+    assert expected.any()
+    predictor.batch_shapes.clear()
+
+    masks = np.concatenate([batch for _, batch in infer_batches(predictor, image, batch_size, tile_size)])
+    assert masks.dtype == np.uint8
+    np.testing.assert_array_equal(masks, expected)
+    for n, h, w in predictor.batch_shapes:
+        assert n <= batch_size
+        assert h % _ENCODER_STRIDE_ == 0 and w % _ENCODER_STRIDE_ == 0
+
+
+def test_normalization_is_per_frame(image):
+    image = image.astype(np.float32)
+    image[1] = image[0] * 7 + 500
+    image[2] = 42
+    masks = np.concatenate([batch for _, batch in infer_batches(PixelPredictor(), image, batch_size=2)])
+    np.testing.assert_array_equal(masks[1], masks[0])
+    assert not masks[2].any()
+
+
+def test_threshold(image):
+    predictor = PixelPredictor()
+    low = np.concatenate([batch for _, batch in infer_batches(predictor, image, tile_size=128, threshold=0.3)])
+    high = np.concatenate([batch for _, batch in infer_batches(predictor, image, tile_size=128, threshold=0.7)])
+    assert (low >= high).all() and (low > high).any()
+    np.testing.assert_array_equal(high[0], infer_frame(predictor, image[0], threshold=0.7))
+
+
+def test_infer_frames(image):
+    predictor = PixelPredictor()
+    results = list(infer_frames(predictor, image, [4, 1, 3], batch_size=2))
+    assert [indices.tolist() for indices, _ in results] == [[1, 3], [4]]
+    masks = np.concatenate([batch for _, batch in results])
+    np.testing.assert_array_equal(masks, np.stack([infer_frame(predictor, image[i]) for i in (1, 3, 4)]))
+
+
+@pytest.fixture
+def model():
+    pytest.importorskip('torch')
+    pytest.importorskip('particle_tracking')
+    from napari_ml_particle_tracking._model import _MODEL_FILE_PATH_, get_model
+
+    if not _MODEL_FILE_PATH_.exists():
+        pytest.skip(f"no trained model at {_MODEL_FILE_PATH_}")
+    return get_model()
+
+
+def test_infer_frame_matches_model_inference(model):
+    rng = np.random.default_rng(0)
+    image = rng.poisson(100, size=(3, 128, 160)).astype(np.uint16)
+    image[:, 40:44, 60:64] += 400
+    for frame in image:
+        expected = np.asarray(model.inference(frame)).astype(np.uint8)
+        np.testing.assert_array_equal(infer_frame(model, frame), expected)
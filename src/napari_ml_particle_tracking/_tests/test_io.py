@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from napari_ml_particle_tracking._io import (
+    _mask_chunks,
+    create_mask_store,
+    is_mask_store,
+    iter_write_mask,
+    read_tracks,
+    write_tracks,
+)
+
+
+def tables():
+    rng = np.random.default_rng(0)
+    tracks = pd.DataFrame({
+        'particle': np.repeat([0, 1], 5),
+        'frame': np.tile(np.arange(5), 2),
+        'y': rng.random(10),
+        'x': rng.random(10),
+        'intensity_mean': rng.random(10),
+    })
+    # integer named columns, as analyse_tracks builds them
+    steps = pd.DataFrame(rng.random((3, 4)))
+    steps['particle'] = [0, 0, 1]
+    meta = pd.DataFrame({'particle': [0, 1], 'frame': [5, 5]})
+    return tracks, steps, meta
+
+
+@pytest.mark.parametrize('suffix', ['.csv', '.parquet', '.feather'])
+def test_round_trip(tmp_path, suffix):
+    if suffix != '.csv':
+        pytest.importorskip('pyarrow')
+    tracks, steps, meta = tables()
+    path = tmp_path / f"tracks{suffix}"
+    write_tracks(path, tracks, steps, meta)
+    read, read_steps, read_meta = read_tracks(path)
+    pd.testing.assert_frame_equal(read, tracks)
+    pd.testing.assert_frame_equal(read_steps, steps, check_column_type=False)
+    pd.testing.assert_frame_equal(read_meta, meta)
+
+
+@pytest.mark.parametrize('suffix', ['.csv', '.parquet', '.feather'])
+def test_reopened_steps_merge_with_new_steps(tmp_path, suffix):
+    if suffix != '.csv':
+        pytest.importorskip('pyarrow')
+    tracks, steps, meta = tables()
+    path = tmp_path / f"tracks{suffix}"
+    write_tracks(path, tracks, steps, meta)
+    _, read_steps, _ = read_tracks(path)
+    merged = pd.concat([read_steps, steps], ignore_index=True)
+    assert list(merged.columns) == list(steps.columns)
+    assert not merged.isna().any().any()
+
+
+def test_missing_side_tables(tmp_path):
+    tracks, _, _ = tables()
+    path = tmp_path / "tracks.csv"
+    write_tracks(path, tracks)
+    _, steps, meta = read_tracks(path)
+    assert steps is None and meta is None
+
+
+def mask_stack(dtype=np.uint8):
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 3, size=(7, 16, 12)).astype(dtype)
+
+
+def test_write_mask_tiff(tmp_path):
+    tifffile = pytest.importorskip('tifffile')
+    mask = mask_stack(np.int32)
+    path = tmp_path / "mask.tif"
+    assert list(iter_write_mask(path, mask, chunk_frames=3)) == [3, 3, 1]
+    with tifffile.TiffFile(path) as tif:
+        assert len(tif.pages) == len(mask)
+        assert all(page.dtype == np.uint8 and page.compression != 1 for page in tif.pages)
+        pages = np.stack([page.asarray() for page in tif.pages])
+    np.testing.assert_array_equal(pages, mask)
+    np.testing.assert_array_equal(tifffile.imread(path), mask)
+
+
+def test_write_mask_zarr(tmp_path):
+    zarr = pytest.importorskip('zarr')
+    mask = mask_stack()
+    path = tmp_path / "mask.zarr"
+    assert list(iter_write_mask(path, mask, chunk_frames=4)) == [4, 3]
+    store = zarr.open(str(path), mode='r')
+    assert store.dtype == np.uint8
+    assert store.chunks == (4, 16, 12)
+    np.testing.assert_array_equal(store[:], mask)
+
+
+def test_mask_chunks_do_not_copy():
+    mask = mask_stack()
+    for start, chunk in _mask_chunks(mask, 3, np.uint8):
+        assert np.shares_memory(chunk, mask)
+        np.testing.assert_array_equal(chunk, mask[start:start + 3])
+    # other dtypes are converted chunk by chunk
+    labels = mask_stack(np.int32)
+    assert not any(np.shares_memory(chunk, labels) for _, chunk in _mask_chunks(labels, 3, np.uint8))
+
+
+def test_create_mask_store(tmp_path):
+    zarr = pytest.importorskip('zarr')
+    path = tmp_path / "mask.zarr"
+    store = create_mask_store(path, (10, 16, 12), chunk_frames=4)
+    assert store.shape == (10, 16, 12)
+    assert store.chunks == (4, 16, 12)
+    assert store.dtype == np.uint8
+    # written frame range by frame range, as segmentation does
+    mask = mask_stack()
+    store[2:9] = mask
+    store[0] = 1
+
+    reopened = zarr.open(str(path), mode='r')
+    np.testing.assert_array_equal(reopened[2:9], mask)
+    assert (reopened[0] == 1).all()
+    assert not reopened[1].any() and not reopened[9].any()
+
+
+def test_is_mask_store(tmp_path):
+    zarr = pytest.importorskip('zarr')
+    store = create_mask_store(tmp_path / "mask.zarr", (3, 8, 8))
+    assert is_mask_store(store)
+    # resegmenting writes into it, read-only stores and arrays are not stores
+    assert not is_mask_store(zarr.open(str(tmp_path / "mask.zarr"), mode='r'))
+    assert not is_mask_store(np.zeros((3, 8, 8), dtype=np.uint8))
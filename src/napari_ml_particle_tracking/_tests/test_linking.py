@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from napari_ml_particle_tracking._linking import link
+
+
+def detections(frames, y=10.0, x=10.0):
+    return pd.DataFrame({
+        'frame': np.asarray(frames, dtype=np.int64),
+        'y': np.full(len(frames), y),
+        'x': np.full(len(frames), x),
+    })
+
+
+def test_links_nearest_detection():
+    features = pd.concat([detections([0, 1, 2], 10.0, 10.0), detections([0, 1, 2], 50.0, 50.0)])
+    features.loc[features['frame'] == 1, 'x'] += 1.0
+    tracks = link(features, search_range=3.0)
+    assert tracks.groupby('particle').size().tolist() == [3, 3]
+    assert tracks.groupby('particle')['y'].nunique().tolist() == [1, 1]
+
+
+def test_far_detection_starts_new_track():
+    features = pd.DataFrame({'frame': [0, 1], 'y': [10.0, 10.0], 'x': [10.0, 20.0]})
+    assert link(features, search_range=3.0)['particle'].nunique() == 2
+
+
+@pytest.mark.parametrize('memory, gap, same_track', [
+    (0, 1, True),
+    (0, 2, False),
+    (1, 2, True),
+    (1, 3, False),
+    (3, 4, True),
+    (3, 5, False),
+])
+def test_memory_over_empty_frames(memory, gap, same_track):
+    # nothing is detected between frame 0 and frame ``gap``
+    tracks = link(detections([0, gap]), search_range=3.0, memory=memory)
+    assert (tracks['particle'].nunique() == 1) == same_track
+
+
+def test_memory_with_other_detections_in_between():
+    # another particle keeps the frames in between non-empty
+    features = pd.concat([detections([0, 2]), detections([0, 1, 2], 50.0, 50.0)])
+    tracks = link(features, search_range=3.0, memory=0).sort_values(['y', 'frame'])
+    assert tracks['particle'].iloc[0] != tracks['particle'].iloc[1]
+    assert tracks[tracks['y'] == 50.0]['particle'].nunique() == 1
+
+
+def test_empty_features():
+    tracks = link(detections([]), search_range=3.0)
+    assert tracks.empty
+    assert 'particle' in tracks.columns
@@ -0,0 +1,40 @@
+import sys
+import types
+
+import pytest
+
+from napari_ml_particle_tracking import _model
+
+
+@pytest.fixture
+def hub(tmp_path, monkeypatch):
+    monkeypatch.setattr(_model, '_HUB_DIR_', tmp_path)
+    checkpoints = tmp_path / 'checkpoints'
+    checkpoints.mkdir()
+    return checkpoints
+
+
+def test_cached_encoder_weights(hub):
+    assert _model.cached_encoder_weights() is None
+    # other resnet18 variants are not the weights smp loads
+    (hub / 'resnet18-f37072fd.pth').touch()
+    (hub / 'resnet18_ssl.pth').touch()
+    assert _model.cached_encoder_weights() is None
+    (hub / 'resnet18-5c106cde.pth').touch()
+    assert _model.cached_encoder_weights() == hub / 'resnet18-5c106cde.pth'
+    assert _model.cached_encoder_weights('resnet34') is None
+
+
+def test_hub_dir_is_restored(hub, tmp_path, monkeypatch):
+    torch = pytest.importorskip('torch')
+    seen = []
+
+    class Model:
+        def __init__(self, **kwargs):
+            seen.append(torch.hub.get_dir())
+
+    monkeypatch.setitem(sys.modules, 'particle_tracking', types.SimpleNamespace(Model=Model))
+    previous = torch.hub.get_dir()
+    _model._load_model(tmp_path / 'model_final.pt')
+    assert seen == [str(tmp_path)]
+    assert torch.hub.get_dir() == previous
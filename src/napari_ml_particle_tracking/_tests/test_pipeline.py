@@ -0,0 +1,150 @@
+import os
+
+import numpy as np
+import pytest
+
+from napari_ml_particle_tracking._io import read_table
+from napari_ml_particle_tracking._pipeline import (
+    MovieRun,
+    PipelineParams,
+    inference_predictor,
+    run_movie,
+    summarize,
+)
+
+tifffile = pytest.importorskip('tifffile')
+
+STAGES = ('features', 'link')
+
+
+@pytest.fixture
+def movie(tmp_path):
+    """A movie and its mask in the output folder, as left by the segment stage."""
+    n_frames = 6
+    image = np.full((n_frames, 32, 32), 100, dtype=np.uint16)
+    mask = np.zeros(image.shape, dtype=np.uint8)
+    for frame in range(n_frames):
+        mask[frame, 4:7, 4 + frame:7 + frame] = 1
+        mask[frame, 20:23, 20:23] = 1
+    path = tmp_path / "movie.tif"
+    tifffile.imwrite(path, image)
+    out = tmp_path / "results"
+    mask_path = MovieRun(path, out, PipelineParams()).outputs['segment']
+    tifffile.imwrite(mask_path, mask)
+    return path, out
+
+
+def skipped(result):
+    assert 'error' not in result, result.get('error')
+    return {stage: info['skipped'] for stage, info in result['stages'].items()}
+
+
+def age(path, seconds):
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime - seconds, stat.st_mtime - seconds))
+
+
+def test_second_run_is_skipped(movie):
+    path, out = movie
+    assert skipped(run_movie(path, out, stages=STAGES)) == {'features': False, 'link': False}
+    run = MovieRun(path, out, PipelineParams())
+    assert all(run.outputs[stage].exists() for stage in STAGES)
+    assert not list(run.dir.glob('*.partial*'))
+    assert skipped(run_movie(path, out, stages=STAGES)) == {'features': True, 'link': True}
+
+
+def test_changed_params_rerun_only_their_stage(movie):
+    path, out = movie
+    run_movie(path, out, stages=STAGES)
+    params = PipelineParams(search_range=5.0)
+    assert skipped(run_movie(path, out, params, stages=STAGES)) == {'features': True, 'link': False}
+    assert skipped(run_movie(path, out, params, stages=STAGES)) == {'features': True, 'link': True}
+    # back to the old parameters is a change as well
+    assert skipped(run_movie(path, out, stages=STAGES)) == {'features': True, 'link': False}
+
+
+def test_newer_input_reruns_stage(movie):
+    path, out = movie
+    run_movie(path, out, stages=STAGES)
+    run = MovieRun(path, out, PipelineParams())
+    for stage in STAGES:
+        age(run.outputs[stage], 60)
+    # a newer mask invalidates the features and, through them, the tracks
+    assert skipped(run_movie(path, out, stages=STAGES)) == {'features': False, 'link': False}
+
+
+def test_overwrite(movie):
+    path, out = movie
+    run_movie(path, out, stages=STAGES)
+    assert skipped(run_movie(path, out, stages=STAGES, overwrite=True)) == {'features': False, 'link': False}
+
+
+def test_missing_input_is_reported(tmp_path):
+    path = tmp_path / "movie.tif"
+    tifffile.imwrite(path, np.zeros((2, 8, 8), dtype=np.uint16))
+    result = run_movie(path, tmp_path / "results", stages=STAGES)
+    assert 'FileNotFoundError' in result['error']
+    assert result['stages'] == {}
+
+
+def test_tracks_and_summary(movie):
+    path, out = movie
+    results = [run_movie(path, out, stages=STAGES)]
+    tracks = MovieRun(path, out, PipelineParams()).outputs['link']
+    assert read_table(tracks)['particle'].nunique() == 2
+    summary = summarize(results).set_index('stage')
+    assert summary.loc[list(STAGES), 'movies'].tolist() == [1, 1]
+    assert summary.loc[['segment', 'steps'], 'movies'].tolist() == [0, 0]
+    assert summary.loc['features', 'units'] == 6
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    """Fake model and predictors, ``backends[name]`` is what get_predictor returns or raises."""
+    from napari_ml_particle_tracking import _backends, _model, _pipeline
+
+    def float32(batch):
+        return batch
+
+    predictors = {'float32': float32}
+
+    def get_predictor(backend, model, calibration=None):
+        predictor = predictors[backend]
+        if isinstance(predictor, Exception):
+            raise predictor
+        return predictor
+
+    monkeypatch.setattr(_model, 'get_model', lambda: object())
+    monkeypatch.setattr(_pipeline, 'apply_torch_threads', lambda: None)
+    monkeypatch.setattr(_backends, 'get_predictor', get_predictor)
+    return predictors
+
+
+def image():
+    return np.random.default_rng(0).random((2, 64, 64)).astype(np.float32)
+
+
+def test_float32_predictor(backends):
+    assert inference_predictor(image()) is backends['float32']
+
+
+def test_valid_backend_is_used(backends, caplog):
+    def int8(batch):
+        return batch + 0.001
+
+    backends['int8'] = int8
+    with caplog.at_level('INFO', logger='napari_ml_particle_tracking._pipeline'):
+        assert inference_predictor(image(), backend='int8') is int8
+    assert "'int8' inference backend" in caplog.text
+
+
+def test_drifting_backend_falls_back(backends):
+    backends['int8'] = lambda batch: 1.0 - batch
+    with pytest.warns(UserWarning, match="falling back to float32"):
+        assert inference_predictor(image(), backend='int8', min_iou=0.95) is backends['float32']
+
+
+def test_failing_backend_falls_back(backends):
+    backends['onnx'] = RuntimeError("export failed")
+    with pytest.warns(UserWarning, match="export failed"):
+        assert inference_predictor(image(), backend='onnx') is backends['float32']
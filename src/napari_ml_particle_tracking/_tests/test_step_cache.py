@@ -0,0 +1,133 @@
+import itertools
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from napari_ml_particle_tracking import _step_cache, _steps
+from napari_ml_particle_tracking._step_cache import (
+    StepCache,
+    _to_bytes,
+    trace_key,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # one tick per call, so last_used never ties
+    ticks = itertools.count()
+    monkeypatch.setattr(_step_cache, 'time', SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+def table(value):
+    return np.full((2, 3), float(value))
+
+
+def test_get_and_put(tmp_path):
+    cache = StepCache(tmp_path / "cache.sqlite")
+    cache.put_many({'a': table(1), 'b': table(2)})
+    found = cache.get_many(['b', 'missing', 'a', 'b'])
+    assert set(found) == {'a', 'b'}
+    np.testing.assert_array_equal(found['b'], table(2))
+    assert len(cache) == 2
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_keys_depend_on_trace_and_params():
+    trace = np.arange(5.0)
+    params = {'tres_h': 0.1, 'n_passes': 3}
+    assert trace_key(trace, params) == trace_key(trace.tolist(), dict(params))
+    assert trace_key(trace, params) != trace_key(trace + 1, params)
+    assert trace_key(trace, params) != trace_key(trace, {**params, 'tres_h': 0.2})
+
+
+def test_lru_eviction(tmp_path, clock):
+    size = len(_to_bytes(table(0)))
+    cache = StepCache(tmp_path / "cache.sqlite", max_bytes=3 * size)
+    for key in 'abc':
+        cache.put_many({key: table(0)})
+    assert len(cache) == 3
+    # 'a' becomes the most recently used, 'b' is the oldest now
+    cache.get_many(['a'])
+    cache.put_many({'d': table(0)})
+    assert set(cache.get_many('abcd')) == {'a', 'c', 'd'}
+    assert cache.total_bytes() <= cache.max_bytes
+
+
+def test_eviction_of_a_large_batch(tmp_path, clock):
+    size = len(_to_bytes(table(0)))
+    cache = StepCache(tmp_path / "cache.sqlite", max_bytes=2 * size)
+    cache.put_many({key: table(0) for key in 'abcde'})
+    assert len(cache) <= 2
+    assert cache.total_bytes() <= cache.max_bytes
+
+
+@pytest.fixture
+def fitted(monkeypatch):
+    """Track ids of every trace that was fitted, a one step fit without particle_tracking."""
+    calls = []
+    detect_chunk = _steps._detect_steps_chunk
+
+    def detect_steps(intensity, tres_h, n_passes):
+        # the largest jump as the only step
+        step = int(np.argmax(np.abs(np.diff(intensity)))) + 1
+        fit = np.r_[np.full(step, intensity[:step].mean()), np.full(len(intensity) - step, intensity[step:].mean())]
+        return fit, np.array([[step, fit[step] - fit[0]]])
+
+    def record(chunk, **kwargs):
+        calls.extend(track_id for track_id, _ in chunk)
+        return detect_chunk(chunk, **kwargs)
+
+    monkeypatch.setattr(_steps, 'detect_steps', detect_steps)
+    monkeypatch.setattr(_steps, '_detect_steps_chunk', record)
+    return calls
+
+
+def traces(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [(track_id, np.repeat([20.0 + track_id, 5.0], 15) + rng.normal(0, 0.5, 30)) for track_id in range(n)]
+
+
+def analyse(items, cache):
+    return _steps.analyse_tracks(items, n_workers=1, chunk_size=2, cache=cache)
+
+
+def test_results_keep_input_order(tmp_path, fitted):
+    cache = StepCache(tmp_path / "cache.sqlite")
+    items = traces(8)
+    expected_steps, expected_count = analyse(items, None)
+    fitted.clear()
+
+    # every other trace is cached, hits and misses alternate
+    analyse(items[::2], cache)
+    assert fitted == [0, 2, 4, 6]
+    fitted.clear()
+    steps, count = analyse(items, cache)
+    assert fitted == [1, 3, 5, 7]
+    assert steps.equals(expected_steps)
+    assert count.equals(expected_count)
+
+    fitted.clear()
+    steps, _ = analyse(items, cache)
+    assert fitted == []
+    assert steps.equals(expected_steps)
+
+
+def test_duplicate_traces(tmp_path, fitted):
+    cache = StepCache(tmp_path / "cache.sqlite")
+    items = traces(3)
+    # the same intensities under another id, once before and once after caching
+    items = [items[0], items[1], (10, items[0][1]), items[2]]
+    expected_steps, _ = analyse(items, None)
+    fitted.clear()
+
+    steps, count = analyse(items, cache)
+    assert steps.equals(expected_steps)
+    assert len(cache) == 3
+    assert count.index.tolist() == [0, 1, 10, 2]
+
+    fitted.clear()
+    steps, _ = analyse([items[2], (11, items[0][1])], cache)
+    assert fitted == []
+    assert steps['particle'].unique().tolist() == [10, 11]
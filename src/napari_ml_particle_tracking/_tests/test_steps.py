@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+
+from napari_ml_particle_tracking._steps import analyse_tracks
+
+
+def largest_jump(intensity, tres_h, n_passes):
+    """One step at the largest jump, and the process that fitted it."""
+    step = int(np.argmax(np.abs(np.diff(intensity)))) + 1
+    fit = np.r_[np.full(step, intensity[:step].mean()), np.full(len(intensity) - step, intensity[step:].mean())]
+    return fit, np.array([[step, fit[step] - fit[0], os.getpid()]])
+
+
+def traces(n, seed=0):
+    rng = np.random.default_rng(seed)
+    track_ids = rng.permutation(10 * n)[:n]
+    items = []
+    for track_id in track_ids:
+        length = int(rng.integers(10, 60))
+        step = int(rng.integers(2, length - 2))
+        items.append((int(track_id), np.r_[np.full(step, 20.0), np.full(length - step, 5.0)] + rng.normal(0, 0.5, length)))
+    return items
+
+
+def test_empty():
+    steps, count = analyse_tracks([], n_workers=1, detect=largest_jump)
+    assert steps.empty and count.empty
+
+
+def test_serial_chunks():
+    items = traces(10)
+    calls = []
+    steps, count = analyse_tracks(items, n_workers=1, chunk_size=3, callback=calls.append, detect=largest_jump)
+    assert calls == [3, 3, 3, 1]
+    assert count.index.tolist() == [track_id for track_id, _ in items]
+    assert (count == 1).all()
+    assert steps[2].unique().tolist() == [os.getpid()]
+
+
+def test_workers_match_serial():
+    items = traces(40)
+    calls = []
+    serial, serial_count = analyse_tracks(items, n_workers=1, detect=largest_jump)
+    parallel, count = analyse_tracks(items, n_workers=2, chunk_size=3, callback=calls.append, detect=largest_jump)
+    # the spawned workers did the fitting
+    assert os.getpid() not in parallel[2].unique()
+    assert sum(calls) == len(items)
+    # merged in the input order, whatever order the chunks finished in
+    assert parallel['particle'].tolist() == [track_id for track_id, _ in items]
+    assert parallel.drop(columns=2).equals(serial.drop(columns=2))
+    assert count.equals(serial_count)
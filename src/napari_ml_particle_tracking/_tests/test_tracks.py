@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from napari_ml_particle_tracking._tracks import (
+    PropertyIndex,
+    TrackIndex,
+    track_ids_key,
+    tracks_frame_count_meta,
+    tracks_layer_data,
+)
+
+
+@pytest.fixture
+def tracks():
+    # interleaved by frame, as the linker writes them
+    rng = np.random.default_rng(0)
+    ids = np.array([3, 1, 7, 3, 1, 3, 1, 9])
+    frames = np.array([0, 0, 0, 1, 1, 2, 3, 5])
+    return pd.DataFrame({
+        'particle': ids,
+        'frame': frames,
+        'y': rng.random(len(ids)),
+        'x': rng.random(len(ids)),
+        'intensity_mean': rng.random(len(ids)),
+    }).sample(frac=1, random_state=1).reset_index(drop=True)
+
+
+def test_offsets(tracks):
+    index = TrackIndex(tracks)
+    np.testing.assert_array_equal(index.track_ids, [1, 3, 7, 9])
+    np.testing.assert_array_equal(index.offsets, [0, 3, 6, 7, 8])
+    np.testing.assert_array_equal(index.lengths, [3, 3, 1, 1])
+    assert len(index) == 4
+    assert 3 in index and 4 not in index
+    # sorted by (particle, frame)
+    np.testing.assert_array_equal(index.columns['frame'][:3], [0, 1, 3])
+
+
+def test_track_lookup(tracks):
+    index = TrackIndex(tracks)
+    expected = tracks[tracks['particle'] == 3].sort_values('frame')
+    track = index.track(3)
+    assert set(track) == set(tracks.columns)
+    for col in tracks.columns:
+        np.testing.assert_array_equal(track[col], expected[col].to_numpy())
+    np.testing.assert_array_equal(index.column(3, 'intensity_mean'), expected['intensity_mean'].to_numpy())
+    with pytest.raises(KeyError):
+        index.track(4)
+
+
+def test_positions_skip_missing_ids(tracks):
+    index = TrackIndex(tracks)
+    np.testing.assert_array_equal(index.positions([9, 100, 1, -5, 4, 1]), [0, 3])
+    assert index.position(100) == -1
+    assert index.positions([]).size == 0
+
+
+def test_rows(tracks):
+    index = TrackIndex(tracks)
+    np.testing.assert_array_equal(index.rows([7, 1]), [0, 1, 2, 6])
+    np.testing.assert_array_equal(index.rows(), np.arange(len(tracks)))
+    empty = index.rows([])
+    assert empty.size == 0 and empty.dtype.kind == 'i'
+    assert index.rows([42]).size == 0
+
+
+@pytest.mark.parametrize('track_ids', [[1, 3], [9], [7, 100, 3], []])
+def test_layer_data_matches_tracks_layer_data(tracks, track_ids):
+    index = TrackIndex(tracks)
+    expected = tracks_layer_data(tracks, track_ids)
+    result = index.layer_data(track_ids)
+    assert result.shape == (len(expected), 4)
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_traces(tracks):
+    index = TrackIndex(tracks)
+    traces = index.traces([9, 3, 5])
+    assert [track_id for track_id, _ in traces] == [3, 9]
+    for track_id, values in traces:
+        expected = tracks[tracks['particle'] == track_id].sort_values('frame')['intensity_mean']
+        np.testing.assert_array_equal(values, expected.to_numpy())
+    assert [track_id for track_id, _ in index.traces()] == [1, 3, 7, 9]
+
+
+def test_empty_index():
+    index = TrackIndex()
+    assert len(index) == 0
+    assert index.rows().size == 0
+    assert index.layer_data().shape == (0, 4)
+    assert index.traces() == []
+    assert 1 not in index
+
+
+def test_track_ids_key():
+    assert np.array_equal(track_ids_key([3, 1, 3]), track_ids_key([1, 3]))
+
+
+def test_frame_count_meta(tracks):
+    meta = tracks_frame_count_meta(tracks)
+    assert meta.set_index('particle')['frame'].to_dict() == {1: 3, 3: 3, 7: 1, 9: 1}
+
+
+@pytest.fixture
+def meta():
+    return pd.DataFrame({
+        'particle': [0, 1, 2, 3, 4, 5],
+        'frame': [10, 3, 7, 3, 12, 1],
+        'intensity_mean': [1.0, np.nan, 5.0, 2.5, np.nan, 4.0],
+    })
+
+
+def test_range_query(meta):
+    index = PropertyIndex(meta)
+    np.testing.assert_array_equal(index.query({'frame': (3, 10)}), [0, 1, 2, 3])
+    np.testing.assert_array_equal(index.query({'frame': (3, 10), 'intensity_mean': (2.0, 5.0)}), [2, 3])
+    np.testing.assert_array_equal(index.query({}), np.arange(len(meta)))
+    assert index.query({'frame': (20, 30)}).size == 0
+
+
+def test_range_query_skips_nan(meta):
+    index = PropertyIndex(meta)
+    np.testing.assert_array_equal(index.query({'intensity_mean': (-np.inf, np.inf)}), [0, 2, 3, 5])
+    np.testing.assert_array_equal(np.sort(index.range_rows('intensity_mean', 0.0, 10.0)), [0, 2, 3, 5])
+
+
+def test_invalidate(meta):
+    index = PropertyIndex(meta)
+    np.testing.assert_array_equal(index.query({'frame': (10, 12)}), [0, 4])
+    meta.loc[5, 'frame'] = 11
+    # stale until the column is invalidated
+    np.testing.assert_array_equal(index.query({'frame': (10, 12)}), [0, 4])
+    index.invalidate(['frame'])
+    np.testing.assert_array_equal(index.query({'frame': (10, 12)}), [0, 4, 5])
+    index.invalidate()
+    assert index.sorted_columns == {}
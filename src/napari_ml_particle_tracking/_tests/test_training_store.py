@@ -0,0 +1,53 @@
+import numpy as np
+
+from napari_ml_particle_tracking._training_store import (
+    TrainingSampleStore,
+    source_id,
+)
+
+
+def movie(seed, shape=(3, 16, 16)):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 1000, size=shape).astype(np.uint16), (rng.random(shape) > 0.8).astype(np.uint8)
+
+
+def test_same_name_and_shape_do_not_collide(tmp_path):
+    store = TrainingSampleStore(tmp_path)
+    first, first_mask = movie(0)
+    second, second_mask = movie(1)
+    source = source_id("Image", first.shape)
+    assert source == source_id("Image", second.shape)
+
+    key_a = store.add(first[1], first_mask[1], source, 1)
+    key_b = store.add(second[1], second_mask[1], source, 1)
+    assert key_a != key_b
+    assert len(store) == 2
+    np.testing.assert_array_equal(store.load(key_a)[0], first[1])
+    np.testing.assert_array_equal(store.load(key_b)[0], second[1])
+
+
+def test_new_edit_replaces_frame(tmp_path):
+    store = TrainingSampleStore(tmp_path)
+    image, mask = movie(0)
+    source = source_id("Image", image.shape)
+    key = store.add(image[0], mask[0], source, 0)
+    assert store.add(image[0], 1 - mask[0], source, 0) == key
+    assert len(store) == 1
+    np.testing.assert_array_equal(store.load(key)[1], 1 - mask[0])
+
+
+def test_sample_and_stack(tmp_path):
+    store = TrainingSampleStore(tmp_path)
+    image, mask = movie(0)
+    keys = store.add_frames(image, mask, [2, 0, 1], source_id("Image", image.shape))
+    assert len(keys) == 3
+
+    picked = store.sample(1, include=keys[:1], rng=np.random.default_rng(0))
+    assert picked[0] == keys[0] and len(picked) == 2 and picked[1] in keys[1:]
+
+    images, masks = store.load_stack(keys)
+    np.testing.assert_array_equal(images, image)
+    np.testing.assert_array_equal(masks, mask)
+
+    store.clear()
+    assert len(store) == 0
@@ -2,32 +2,25 @@ import os
 import sys
 from pathlib import Path
 from typing import Optional
-from PyQt5 import QtCore
-from PyQt5.QtWidgets import QWidget
 import napari
 import numpy as np
-import tifffile
 import pandas as pd
 from napari.utils import progress
 
 from qtpy.QtWidgets import QWidget, QTableView, QVBoxLayout, QHBoxLayout, QTabWidget, QComboBox, QPushButton,\
                             QSpinBox, QDoubleSpinBox, QFileDialog, QMessageBox
-from qtpy.QtCore import QItemSelectionModel, Qt, QModelIndex, Signal
+from qtpy.QtCore import QItemSelectionModel, Qt, QModelIndex, Signal, QTimer
 from superqt import QLabeledRangeSlider
 
 from ._table_widget import DataFrameModel
 from ._plots import HistogramWidget
 from ._base_widget import NapariLayersWidget
+from ._tracks import PropertyIndex, tracks_frame_count_meta
 
 def create_display_dataframe(dataframe:pd.DataFrame, group_column:str='particle', count_column:str='frame')->pd.DataFrame:
         df_group = dataframe.groupby(group_column, group_keys=True)[count_column].count()
         return pd.DataFrame(df_group)
 
-def tracks_frame_count_meta(dataframe:pd.DataFrame, track_id_col:str='particle', frame_col:str= 'frame')-> pd.DataFrame:
-    sr = dataframe.groupby(track_id_col, as_index=False, group_keys=True, dropna=True)[frame_col].count()
-    return pd.DataFrame(sr)
-
-
 class PropertiesComboBox(QComboBox):
     def __init__(self, properties:list, parent: QWidget = None) -> None:
         super().__init__(parent)
@@ -40,11 +33,19 @@ class PropertiesComboBox(QComboBox):
 
 class TrackFilter(QWidget):
     metaUpdated = Signal()
+    # track id of the current table row
+    trackSelected = Signal(object)
     def __init__(self, parent: QWidget = None ,) -> None:
         super().__init__(parent)
         self.database = pd.DataFrame()
         self.database_meta = pd.DataFrame()
         self.display_meta = pd.DataFrame()
+        # track id -> row position in database_meta
+        self.meta_index = pd.Index([])
+        self.property_index = PropertyIndex()
+        # active {property: (vmin, vmax)} filters, all of them are combined
+        self.filter_ranges = {}
+        self.initialized = False
 
         self.layout = QVBoxLayout()
         self.setLayout(self.layout)
@@ -58,6 +59,7 @@ class TrackFilter(QWidget):
         self.table = QTableView()
         self.data_model = DataFrameModel()
         self.table.setModel(self.data_model)
+        self.table.setSortingEnabled(True)
         self.table_selection = QItemSelectionModel(self.data_model)
         self.table.setSelectionModel(self.table_selection)
         self.tab_widget.addTab(self.table, "Property Table")
@@ -69,31 +71,52 @@ class TrackFilter(QWidget):
         self.sl_length.setOrientation(Qt.Orientation.Horizontal)
         control_layout.addWidget(self.sl_length)
         control_layout.addWidget(self.cb_properties)
+        self.btn_clear_filters = QPushButton("Clear Filters")
+        control_layout.addWidget(self.btn_clear_filters)
+
+        # the filter is applied on slider release or once the slider is idle
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(150)
+        self.filter_timer.timeout.connect(self.apply_filter)
 
 
         self.layout.addLayout(control_layout)
         self.layout.addWidget(self.tab_widget)
     
     def init(self):
-        self.sl_length.valueChanged.connect(self.length_changed)
+        if self.initialized:
+            return
+        self.initialized = True
+        self.sl_length.valueChanged.connect(self.slider_moved)
         self.sl_length.sliderReleased.connect(self.range_change)
         self.table_selection.currentChanged.connect(self.table_current_changed)
         self.cb_properties.currentTextChanged.connect(self.update_view)
-    
+        self.btn_clear_filters.clicked.connect(self.clear_filters)
+
+    def slider_moved(self, vrange):
+        self.filter_ranges[self.cb_properties.currentText()] = tuple(vrange)
+        self.histogram_widget.set_range(*vrange)
+        self.filter_timer.start()
+
     def range_change(self):
-        print("range_change")
+        # apply right away on release
+        self.filter_timer.stop()
+        self.apply_filter()
 
     def table_current_changed(self, current, previous):
         if (not current.isValid()):
             return
-        
-        print(f"{current.row()} - {self.data_model.data(current)}")
-        
-        #  currentChanged(const QModelIndex &current, const QModelIndex &previous)
+        # the view may be sorted, map back to the displayed meta row
+        row = self.data_model.source_row(current.row())
+        self.trackSelected.emit(self.display_meta['particle'].iloc[row])
 
     def set_data(self, database:pd.DataFrame, database_meta:pd.DataFrame, default_filter:str='frame'):
         self.database = database
-        self.database_meta = database_meta
+        self.database_meta = database_meta.reset_index(drop=True)
+        self.meta_index = pd.Index(self.database_meta['particle'])
+        self.property_index = PropertyIndex(self.database_meta)
+        self.filter_ranges = {}
         self.display_meta = self.database_meta
 
         self.cb_properties.set_properties(self.database_meta.columns)
@@ -103,32 +126,71 @@ class TrackFilter(QWidget):
         
     def update_view(self):
         current_filter = self.cb_properties.currentText()
-        self.data_model.setDataframe(self.display_meta)
-        data_range = (np.min(self.display_meta[current_filter]), np.max(self.display_meta[current_filter]))
+        if current_filter not in self.database_meta.columns:
+            return
+        # the slider spans the full data, other property filters stay active
+        data_range = (np.min(self.database_meta[current_filter]), np.max(self.database_meta[current_filter]))
+        self.sl_length.blockSignals(True)
         self.sl_length.setRange(data_range[0], data_range[1])
-        self.sl_length.setValue(data_range)
-        self.histogram_widget.draw(self.display_meta[current_filter], label=current_filter)
+        self.sl_length.setValue(self.filter_ranges.get(current_filter, data_range))
+        self.sl_length.blockSignals(False)
+        self.histogram_widget.set_data(self.database_meta[current_filter], label=current_filter)
+        self.histogram_widget.set_range(*self.sl_length.value())
+        self.apply_filter()
+
+    def clear_filters(self):
+        self.filter_ranges = {}
+        self.update_view()
 
     def length_changed(self, vrange):
-        vmin, vmax = vrange
-        # print("range:", vmin, vmax)
+        self.filter_ranges[self.cb_properties.currentText()] = tuple(vrange)
+        self.apply_filter()
+
+    def apply_filter(self):
         current_filter = self.cb_properties.currentText()
-        self.display_meta = self.database_meta[(self.database_meta[current_filter] >= vmin) & (self.database_meta[current_filter] <= vmax)]
+        rows = self.property_index.query(self.filter_ranges)
+        self.display_meta = self.database_meta.iloc[rows]
         self.data_model.setDataframe(self.display_meta)
-        self.histogram_widget.draw(self.display_meta[current_filter], label=current_filter)
+        self.histogram_widget.update_counts(self.display_meta[current_filter])
         self.metaUpdated.emit()
     
     def get_current_meta(self):
         return self.display_meta
     
     def update_meta(self, track_id, col_nam, val):
-        self.database_meta.loc[self.database_meta['particle']==track_id, col_nam] = val
-        current_range = (self.sl_length.minimum(), self.sl_length.maximum())
-        self.length_changed(current_range)
+        values = pd.Series(np.atleast_1d(val), index=np.atleast_1d(track_id), name=col_nam)
+        self.update_meta_bulk(values)
+
+    def update_meta_bulk(self, values, col_name:str=None):
+        """
+        Update track meta from a Series/DataFrame indexed by track id, then
+        refresh the view once for the whole batch.
+        """
+        if isinstance(values, pd.Series):
+            values = values.to_frame(col_name or values.name)
+        rows = self.meta_index.get_indexer(values.index)
+        found = rows >= 0
+        for col in values.columns:
+            if col not in self.database_meta.columns:
+                self.database_meta[col] = np.nan
+            col_pos = self.database_meta.columns.get_loc(col)
+            self.database_meta.iloc[rows[found], col_pos] = values[col].to_numpy()[found]
+        self.property_index.invalidate(values.columns)
+        if self.cb_properties.currentText() in values.columns:
+            # the full-data histogram of the current property changed
+            current_filter = self.cb_properties.currentText()
+            self.histogram_widget.set_data(self.database_meta[current_filter], label=current_filter)
+            self.histogram_widget.set_range(*self.sl_length.value())
+        self.refresh_view()
+
+    def refresh_view(self):
+        # re-apply the current filter and pick up new meta columns without resetting the slider
         current_filter = self.cb_properties.currentText()
+        self.cb_properties.blockSignals(True)
         self.cb_properties.set_properties(self.database_meta.columns)
         self.cb_properties.setCurrentText(current_filter)
-        # tracks.loc[tracks['particle'] == 64, 'step_size'] = 12
+        self.cb_properties.blockSignals(False)
+        self.apply_filter()
 
 
 if __name__ == "__main__":
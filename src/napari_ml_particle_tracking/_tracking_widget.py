@@ -3,28 +3,42 @@ import sys
 from pathlib import Path
 import typing
 import copy
+import time
 
 import numpy as np
 import napari
 from napari.utils import progress
+from napari.utils.notifications import show_info
 
-from qtpy.QtWidgets import QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QLabel, QWidget, QListWidget, QListWidgetItem, QSpinBox, QDoubleSpinBox, QFileDialog, QMessageBox
+from qtpy.QtWidgets import QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QLabel, QWidget, QListWidget, QListWidgetItem, QSpinBox, QDoubleSpinBox, QFileDialog, QMessageBox, QCheckBox
 from superqt import QLabeledSlider as QSlider
 from qtpy.QtGui import QStandardItemModel
-from qtpy.QtCore import Signal, QItemSelectionModel, QModelIndex, Qt
+from qtpy.QtCore import Signal, QItemSelectionModel, QModelIndex, Qt, QTimer
 from ._base_widget import NapariLayersWidget
-from ._track_filter import TrackFilter, tracks_frame_count_meta
+from ._track_filter import TrackFilter
+from ._tracks import TrackIndex, track_ids_key
+from ._pipeline import track_stack, find_steps, track_meta
+from ._step_cache import StepCache
+from ._io import TRACK_FILE_FILTER, TRACK_COLUMNS, read_tracks, write_tracks
+from ._config import get_config, set_config, save_config
 import pandas as pd
 
 
 class TrackingWidget(NapariLayersWidget):
+    # {column: values} of the track selected in the property table
+    track_selected = Signal(object)
+
     def __init__(self, napari_viewer: napari.viewer.Viewer = None, parent: QWidget = None):
         super().__init__(napari_viewer, parent)
 
         # members
         self.filtered_track_layer:napari.layers.Tracks = None
+        self.tracked_df = pd.DataFrame()
+        self.track_index = TrackIndex()
         self.tracks = np.zeros([1])
+        self.tracks_key = None
         self.steps_info = pd.DataFrame()
+        self.step_cache = None
         #/ members
 
 
@@ -46,10 +60,35 @@ class TrackingWidget(NapariLayersWidget):
 
         self.layer_layout.addRow("Search Range", self.sb_search_range)
         self.layer_layout.addRow("Memory", self.sb_memory)
+        self.cb_track_columns_only = QCheckBox()
+        self.cb_track_columns_only.setToolTip(", ".join(TRACK_COLUMNS))
+        self.layer_layout.addRow("Open track columns only", self.cb_track_columns_only)
+        self.cb_step_cache = QCheckBox()
+        self.cb_step_cache.setCheckState(Qt.CheckState.Checked)
+        self.cb_step_cache.setToolTip("Reuse step fits of unchanged traces across filter changes and sessions")
+        self.layer_layout.addRow("Cache step fits", self.cb_step_cache)
+
+        config = get_config()
+        self.sb_feature_workers = QSpinBox()
+        self.sb_feature_workers.setRange(0, 1024)
+        self.sb_feature_workers.setValue(config.feature_workers)
+        self.sb_step_workers = QSpinBox()
+        self.sb_step_workers.setRange(0, 1024)
+        self.sb_step_workers.setValue(config.step_workers)
+        self.layer_layout.addRow("Feature threads (0 = auto)", self.sb_feature_workers)
+        self.layer_layout.addRow("Step finder processes (0 = auto)", self.sb_step_workers)
+        # saved to config.json once the spin boxes are idle
+        self.config_timer = QTimer(self)
+        self.config_timer.setSingleShot(True)
+        self.config_timer.setInterval(500)
+        self.config_timer.timeout.connect(lambda: save_config(get_config()))
+        self.sb_feature_workers.valueChanged.connect(lambda v: self.config_changed(feature_workers=v))
+        self.sb_step_workers.valueChanged.connect(lambda v: self.config_changed(step_workers=v))
         self.layout().addWidget(self.btn_track)
 
         self.track_filter_widget = TrackFilter()
         self.layout().addWidget(self.track_filter_widget)
+        self.track_filter_widget.trackSelected.connect(self.select_track)
         # self.track_filter_widget.metaUpdated.connect(self.pd_to_tracks)
         self.btn_display_track = QPushButton("Display Tracks")
         self.btn_analyse_steps = QPushButton("Analyse Steps")
@@ -60,7 +99,9 @@ class TrackingWidget(NapariLayersWidget):
         self.layout().addLayout(btn_layout)
         self.btn_display_track.clicked.connect(self.pd_to_tracks)
         self.btn_analyse_steps.clicked.connect(self.analyse_steps)
-        
+        self.btn_track.clicked.connect(self.track)
+        self.update_btns()
+
     def update_btns(self):
         if self.combo_image_layers.count() and self.combo_mask_layers.count():
             self.btn_track.setDisabled(False)
@@ -69,95 +110,109 @@ class TrackingWidget(NapariLayersWidget):
 
     def save(self):
         if not self.tracked_df.empty:
-            file_path = QFileDialog.getSaveFileName(self, caption="Save Tracks", directory=str(Path.home()), filter="*.csv")
-            self.tracked_df.to_csv(file_path[0], sep=",")
+            file_path = QFileDialog.getSaveFileName(self, caption="Save Tracks", directory=str(Path.home()), filter=TRACK_FILE_FILTER)
+            if not file_path[0]:
+                return
+            path = Path(file_path[0])
+            if not path.suffix:
+                path = path.with_suffix('.csv')
+            # steps and track meta are saved next to the tracks in the same format
+            try:
+                write_tracks(path, self.tracked_df, self.steps_info, self.track_filter_widget.database_meta)
+            except (ValueError, ImportError) as e:
+                QMessageBox.warning(self, "Track Save error", str(e))
         else:
             QMessageBox.warning(self, "Track Save error", "There are no tracks ")
 
     def open(self):
-        file_path = QFileDialog.getOpenFileName(self, caption="Open Tracks", directory=str(Path.home()), filter="*.csv")
-        self.tracked_df = pd.read_csv(file_path[0], sep=',')
-        self.tracked_df_group = self.tracked_df.groupby('particle', as_index=False, group_keys=True, dropna=True)
-        if not self.tracked_df.empty:
-            meta_tracks = tracks_frame_count_meta(self.tracked_df, track_id_col='particle', frame_col='frame')
-            self.track_filter_widget.set_data(self.tracked_df, meta_tracks)
+        file_path = QFileDialog.getOpenFileName(self, caption="Open Tracks", directory=str(Path.home()), filter=TRACK_FILE_FILTER)
+        if not file_path[0]:
+            return
+        columns = TRACK_COLUMNS if self.cb_track_columns_only.isChecked() else None
+        try:
+            tracked_df, steps_info, meta_tracks = read_tracks(file_path[0], columns=columns)
+        except (ValueError, ImportError) as e:
+            QMessageBox.warning(self, "Track Open error", str(e))
+            return
+        if not tracked_df.empty:
+            self.set_tracks(tracked_df, meta_tracks, steps_info)
             # self.pd_to_tracks()
         else:
-            QMessageBox.warning(self, "Track Open error", "Csv file is not compatible ")
+            QMessageBox.warning(self, "Track Open error", "Track file is not compatible ")
+
+    def set_tracks(self, tracked_df:pd.DataFrame, meta_tracks:pd.DataFrame=None, steps_info:pd.DataFrame=None):
+        self.tracked_df = tracked_df
+        # every per-track lookup goes through this index
+        self.track_index = TrackIndex(self.tracked_df)
+        self.tracks_key = None
+        self.steps_info = steps_info if steps_info is not None else pd.DataFrame()
+        if meta_tracks is None:
+            meta_tracks = track_meta(self.tracked_df)
+        self.track_filter_widget.set_data(self.tracked_df, meta_tracks)
+
+    def track(self):
+        image_layer = self.viewer.layers[self.combo_image_layers.currentData()]
+        mask_layer = self.viewer.layers[self.combo_mask_layers.currentData()]
+        n_frames = mask_layer.data.shape[0]
+        self.btn_track.setDisabled(True)
+
+        start = time.perf_counter()
+        # same stage functions as the headless pipeline
+        with progress(total=n_frames, desc="Tracking") as pbar:
+            tracked_df = track_stack(mask_layer.data, image_layer.data, self.sb_search_range.value(),
+                                     self.sb_memory.value(), callback=pbar.update)
+        elapsed = time.perf_counter() - start
+        self.btn_track.setDisabled(False)
+
+        if tracked_df.empty:
+            QMessageBox.warning(self, "Tracking error", "No particles found in the mask layer")
+            return
+        self.set_tracks(tracked_df)
+        show_info(f"Tracked {n_frames} frames, {len(self.tracked_df)} detections at {n_frames / elapsed:.1f} frames/s")
     
     def pd_to_tracks(self):
         print("pd_to_tracks")
         self.btn_display_track.setDisabled(True)
         track_ids = self.track_filter_widget.get_current_meta()['particle']
-        if self.tracks.ndim >1:
-            print("track display check ", len(self.tracks), len(track_ids))
-            if len(self.tracks) == len(track_ids):
-                return
+        key = track_ids_key(track_ids)
+        if self.tracks_key is not None and np.array_equal(self.tracks_key, key):
+            # same filtered track set as the one displayed
+            self.btn_display_track.setDisabled(False)
+            return
+
+        self.tracks = self.track_index.layer_data(key)
+        self.tracks_key = key
 
-        self.tracks = []
-        for id in progress(track_ids, desc="Creating tracks"):
-            track:pd.DataFrame = self.tracked_df_group.get_group(id)
-            if not len(self.tracks) :
-                self.tracks = track[['particle', 'frame', 'y', 'x']].to_numpy()
-            else:
-                self.tracks = np.concatenate([self.tracks, track[['particle', 'frame', 'y', 'x']].to_numpy()])
-        
-        
         if self.filtered_track_layer == None:
             self.filtered_track_layer = self.viewer.add_tracks(self.tracks, name="Tracks")
         else:
             self.filtered_track_layer.data = self.tracks
         self.btn_display_track.setDisabled(False)
 
-    def detect_steps(self, intensity):
-        # Auto step finder
-        import particle_tracking.stepfindCore as core
-        import particle_tracking.stepfindInOut as sio
-        import particle_tracking.stepfindTools as st
-        from particle_tracking.utils import Fit2StepsTable
-        if not len(intensity):
-            return
-        dataX = np.array(intensity)
-        FitX = 0 * dataX
-
-        # multipass:
-        for ii in range(0, 3, 1):
-            # work remaining part of data:
-            residuX = dataX - FitX
-            newFitX, _, _, S_curve, best_shot = core.stepfindcore(
-                residuX, 0.1
-            )
-            FitX = st.AppendFitX(newFitX, FitX, dataX)
-            # storage for plotting:
-            if ii == 0:
-                Fits = np.copy(FitX)
-                S_curves = np.copy(S_curve)
-                best_shots = [best_shot]
-            elif best_shot > 0:
-                Fits = np.vstack([Fits, FitX])
-                S_curves = np.vstack([S_curves, S_curve])
-                best_shots = np.hstack([best_shots, best_shot])
-
-        # steps from final fit:
-        steptable = Fit2StepsTable(dataX, FitX)
-
-        # self.intensity_plot.set_steps(list(FitX))
-        # self.plot_widget.clear()
-        return FitX, steptable
-
     def analyse_steps(self):
         self.btn_analyse_steps.setDisabled(True)
         track_ids = self.track_filter_widget.get_current_meta()['particle']
-        for id in progress(track_ids, desc="Detecting steps"):
-            track:pd.DataFrame = self.tracked_df_group.get_group(id)
-            intensity = track['intensity_mean']
-            fitx, steptable = self.detect_steps(intensity)
-            print(f"track_id: {id}, step count: {len(steptable)}, inteisitylen : {len(intensity)}")
-            self.track_filter_widget.update_meta(id, 'step_count', len(steptable))
-            steps_df  = pd.DataFrame(steptable)
-            steps_df['particle'] = id
-            self.steps_info = pd.concat([self.steps_info, steps_df])
+        cache = None
+        if self.cb_step_cache.isChecked():
+            if self.step_cache is None:
+                self.step_cache = StepCache()
+            cache = self.step_cache
+        with progress(total=len(track_ids), desc="Detecting steps") as pbar:
+            steps_df, step_count = find_steps(self.track_index, track_ids, callback=pbar.update, cache=cache)
+
+        if not self.steps_info.empty:
+            # re-analysed tracks replace their previous steps
+            previous = self.steps_info[~self.steps_info['particle'].isin(step_count.index)]
+            steps_df = pd.concat([previous, steps_df], ignore_index=True)
+        self.steps_info = steps_df
+        self.track_filter_widget.update_meta_bulk(step_count, 'step_count')
 
         self.btn_analyse_steps.setDisabled(False)
 
-        
+    def config_changed(self, **values):
+        set_config(**values)
+        self.config_timer.start()
+
+    def select_track(self, track_id):
+        if track_id in self.track_index:
+            self.track_selected.emit(self.track_index.track(track_id))
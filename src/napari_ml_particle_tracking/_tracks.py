@@ -0,0 +1,156 @@
+"""
+Qt free helpers to turn track tables into napari layer data and track meta,
+and to run range queries on the track meta (``PropertyIndex``).
+
+``TrackIndex`` keeps a track table sorted by (particle, frame) as plain
+column arrays plus CSR style track offsets, so a single track is a slice
+of every column and a set of tracks is one gather.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+_TRACK_COLUMNS_ = ['particle', 'frame', 'y', 'x']
+
+
+def tracks_layer_data(tracked_df: pd.DataFrame, track_ids: Sequence, columns: Sequence[str] = _TRACK_COLUMNS_) -> np.ndarray:
+    """
+    napari Tracks data ``[particle, frame, y, x]`` for the given track ids,
+    built with a single ``isin`` selection and sorted by (particle, frame).
+    """
+    selected = tracked_df.loc[tracked_df['particle'].isin(track_ids), list(columns)]
+    data = selected.to_numpy()
+    order = np.lexsort((data[:, 1], data[:, 0]))
+    return data[order]
+
+
+def track_ids_key(track_ids: Sequence) -> np.ndarray:
+    """Order independent key of a set of track ids, compare with ``np.array_equal``."""
+    return np.unique(np.asarray(track_ids))
+
+
+def tracks_frame_count_meta(dataframe: pd.DataFrame, track_id_col: str = 'particle', frame_col: str = 'frame') -> pd.DataFrame:
+    sr = dataframe.groupby(track_id_col, as_index=False, group_keys=True, dropna=True)[frame_col].count()
+    return pd.DataFrame(sr)
+
+
+class PropertyIndex:
+    """
+    Sorted index over the columns of a meta table, a range query on a
+    column is two ``searchsorted`` calls. Columns are indexed on first use.
+    """
+    def __init__(self, dataframe: Optional[pd.DataFrame] = None) -> None:
+        self.dataframe = pd.DataFrame() if dataframe is None else dataframe
+        self.sorted_columns = {}
+
+    def invalidate(self, columns=None):
+        if columns is None:
+            self.sorted_columns = {}
+        for col in columns or []:
+            self.sorted_columns.pop(col, None)
+
+    def _sorted(self, col):
+        if col not in self.sorted_columns:
+            values = self.dataframe[col].to_numpy()
+            order = np.argsort(values, kind='stable')
+            self.sorted_columns[col] = (order, values[order])
+        return self.sorted_columns[col]
+
+    def range_rows(self, col, vmin, vmax) -> np.ndarray:
+        """Row positions with ``vmin <= value <= vmax``, unordered."""
+        order, values = self._sorted(col)
+        start = np.searchsorted(values, vmin, side='left')
+        stop = np.searchsorted(values, vmax, side='right')
+        return order[start:stop]
+
+    def query(self, ranges:dict) -> np.ndarray:
+        """Sorted row positions matching all ``{column: (vmin, vmax)}`` ranges."""
+        mask = np.ones(len(self.dataframe), dtype=bool)
+        for col, (vmin, vmax) in ranges.items():
+            col_mask = np.zeros(len(self.dataframe), dtype=bool)
+            col_mask[self.range_rows(col, vmin, vmax)] = True
+            mask &= col_mask
+        return np.flatnonzero(mask)
+
+
+class TrackIndex:
+    """
+    Build once per track table (on open/track), then look tracks up by id.
+    ``track(id)`` and ``column(id, col)`` return zero-copy views.
+    """
+    def __init__(self, tracked_df: Optional[pd.DataFrame] = None) -> None:
+        if tracked_df is None:
+            tracked_df = pd.DataFrame(columns=_TRACK_COLUMNS_ + ['intensity_mean'])
+        particle = tracked_df['particle'].to_numpy()
+        order = np.lexsort((tracked_df['frame'].to_numpy(), particle))
+        self.columns: Dict[str, np.ndarray] = {
+            col: np.ascontiguousarray(tracked_df[col].to_numpy()[order]) for col in tracked_df.columns}
+        ids = self.columns['particle']
+        # first row of every track, offsets[i]:offsets[i + 1] are the rows of track_ids[i]
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]]) if len(ids) else np.zeros(0, dtype=np.int64)
+        self.track_ids = ids[starts]
+        self.offsets = np.r_[starts, len(ids)].astype(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.track_ids)
+
+    def __contains__(self, track_id) -> bool:
+        return self.position(track_id) >= 0
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def position(self, track_id) -> int:
+        """Position of ``track_id`` in ``track_ids``, -1 if it is not indexed."""
+        pos = int(np.searchsorted(self.track_ids, track_id))
+        if pos < len(self.track_ids) and self.track_ids[pos] == track_id:
+            return pos
+        return -1
+
+    def positions(self, track_ids: Sequence) -> np.ndarray:
+        """Sorted positions of the indexed ones among ``track_ids``."""
+        track_ids = np.unique(np.asarray(track_ids))
+        pos = np.searchsorted(self.track_ids, track_ids)
+        inside = pos < len(self.track_ids)
+        pos, track_ids = pos[inside], track_ids[inside]
+        # a missing id lands on its successor, keep exact matches only
+        return pos[self.track_ids[pos] == track_ids]
+
+    def slice(self, track_id) -> slice:
+        pos = self.position(track_id)
+        if pos < 0:
+            raise KeyError(track_id)
+        return slice(int(self.offsets[pos]), int(self.offsets[pos + 1]))
+
+    def column(self, track_id, col: str) -> np.ndarray:
+        return self.columns[col][self.slice(track_id)]
+
+    def track(self, track_id) -> Dict[str, np.ndarray]:
+        """``{column: values}`` of one track, ordered by frame."""
+        rows = self.slice(track_id)
+        return {col: values[rows] for col, values in self.columns.items()}
+
+    def rows(self, track_ids: Optional[Sequence] = None) -> np.ndarray:
+        """Row positions of ``track_ids`` in the sorted columns, grouped by track."""
+        if track_ids is None:
+            return np.arange(self.offsets[-1])
+        pos = self.positions(track_ids)
+        starts = self.offsets[pos]
+        lengths = self.offsets[pos + 1] - starts
+        # concatenated ranges starts[i]:starts[i] + lengths[i] without a Python loop
+        shift = np.repeat(starts - np.r_[0, np.cumsum(lengths)[:-1]], lengths)
+        return shift + np.arange(lengths.sum())
+
+    def layer_data(self, track_ids: Optional[Sequence] = None, columns: Sequence[str] = _TRACK_COLUMNS_) -> np.ndarray:
+        """napari Tracks data, same result as ``tracks_layer_data``."""
+        rows = self.rows(track_ids)
+        return np.column_stack([self.columns[col][rows] for col in columns])
+
+    def traces(self, track_ids: Optional[Sequence] = None, column: str = 'intensity_mean') -> List[Tuple[object, np.ndarray]]:
+        """``(track_id, values)`` views in track id order, all tracks when ``track_ids`` is None."""
+        pos = np.arange(len(self.track_ids)) if track_ids is None else self.positions(track_ids)
+        values = self.columns[column]
+        return [(track_id, values[start:stop])
+                for track_id, start, stop in zip(self.track_ids[pos].tolist(), self.offsets[pos].tolist(), self.offsets[pos + 1].tolist())]
@@ -0,0 +1,96 @@
+"""
+Persistent store of curated (image, mask) training frames.
+
+Every frame edited in paint mode is saved as one compressed ``.npz`` file
+under ``~/.ml_particle_tracking/training_samples``, so corrections
+accumulate across sessions. Incremental fine-tuning replays the new frames
+together with a random sample of the stored ones instead of the full movie.
+"""
+import hashlib
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ._model import _MODEL_DIR_
+
+_STORE_DIR_ = _MODEL_DIR_.joinpath('training_samples')
+
+
+def source_id(name: str, shape: Sequence[int]) -> str:
+    """Short stable id of an image stack, used to group its frames in the store."""
+    text = f"{name}:{'x'.join(str(s) for s in shape)}"
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+
+
+def frame_digest(image: np.ndarray) -> str:
+    """Short hash of the pixel data of one frame."""
+    image = np.ascontiguousarray(image)
+    digest = hashlib.blake2b(digest_size=6)
+    digest.update(f"{image.dtype.str}:{image.shape}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class TrainingSampleStore:
+    def __init__(self, root: Path = _STORE_DIR_) -> None:
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        return self.root.joinpath(f"{key}.npz")
+
+    def keys(self) -> List[str]:
+        if not self.root.exists():
+            return []
+        return sorted(path.stem for path in self.root.glob('*.npz'))
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def add(self, image: np.ndarray, mask: np.ndarray, source: str, frame: int) -> str:
+        """
+        Store one frame pair, a newer edit of the same frame replaces the old
+        one. The key includes a hash of the image, so different movies that
+        share a layer name and shape do not overwrite each other's frames.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        image = np.asarray(image)
+        key = f"{source}_{int(frame):06d}_{frame_digest(image)}"
+        np.savez_compressed(self._path(key), image=image, mask=np.asarray(mask, dtype=np.uint8))
+        return key
+
+    def add_frames(self, image_data, mask_data, indices: Iterable[int], source: str) -> List[str]:
+        return [self.add(image_data[i], mask_data[i], source, i) for i in sorted(indices)]
+
+    def load(self, key: str) -> Tuple[np.ndarray, np.ndarray]:
+        with np.load(self._path(key)) as sample:
+            return sample['image'], sample['mask']
+
+    def remove(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        for key in self.keys():
+            self.remove(key)
+
+    def sample(self, n_replay: int, include: Sequence[str] = (), rng: Optional[np.random.Generator] = None) -> List[str]:
+        """``include`` plus up to ``n_replay`` randomly drawn older samples (replay buffer)."""
+        rng = rng or np.random.default_rng()
+        include = list(include)
+        older = [key for key in self.keys() if key not in set(include)]
+        n_replay = min(max(0, n_replay), len(older))
+        replay = [str(key) for key in rng.choice(older, size=n_replay, replace=False)] if n_replay else []
+        return include + replay
+
+    def load_stack(self, keys: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Stack the samples that share the frame shape of the first key."""
+        images, masks = [], []
+        for key in keys:
+            image, mask = self.load(key)
+            if images and image.shape != images[0].shape:
+                continue
+            images.append(image)
+            masks.append(mask)
+        if not images:
+            return np.zeros((0, 0, 0)), np.zeros((0, 0, 0), dtype=np.uint8)
+        return np.stack(images), np.stack(masks)
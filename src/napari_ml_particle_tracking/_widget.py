@@ -1,6 +1,5 @@
 from typing import TYPE_CHECKING
 import numpy as np
-from magicgui import magic_factory
 from qtpy.QtWidgets import QVBoxLayout, QWidget, QDockWidget
 
 # from magicgui.widgets import Container
@@ -31,9 +30,10 @@ class PluginWrapper(QWidget):
         # track_dock = self.viewer.window.add_dock_widget(self.tracking_widget, name="Tracking")
         # track_dock.setFeatures(QDockWidget.DockWidgetFeature.DockWidgetFloatable|QDockWidget.DockWidgetFeature.DockWidgetMovable|QDockWidget.DockWidgetFeature.DockWidgetVerticalTitleBar)
 
-        # self.step_finder_widget = StepFinderWidget(napari_viewer=napari_viewer)
-        # self.vbox_layout.addWidget(self.step_finder_widget)
+        self.step_finder_widget = StepFinderWidget(napari_viewer=napari_viewer)
+        self.vbox_layout.addWidget(self.step_finder_widget)
         # step_dock = self.viewer.window.add_dock_widget(self.step_finder_widget, name="Plots")
         # step_dock.setFeatures(QDockWidget.DockWidgetFeature.DockWidgetFloatable|QDockWidget.DockWidgetFeature.DockWidgetMovable|QDockWidget.DockWidgetFeature.DockWidgetVerticalTitleBar)
 
-        # self.tracking_widget.track_selected.connect(self.step_finder_widget.set_track)
\ No newline at end of file
+        # tracks picked in the property table are plotted with their intensity
+        self.tracking_widget.track_selected.connect(self.step_finder_widget.set_track)